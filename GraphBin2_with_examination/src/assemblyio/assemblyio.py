@@ -0,0 +1,782 @@
+#!/usr/bin/env python
+
+"""
+Streaming readers of assembly files.
+
+Files are read in large binary blocks of whole lines and the records of each block
+are parsed in bulk with regular expressions, so that no Python object is made per
+line and sequences are never decoded. Every block starts with a newline, so records
+are found by searching for a newline followed by their tag.
+
+All readers accept gzip, bzip2 and zstd compressed files, which are decompressed in a
+background thread while the data is parsed.
+
+Uncompressed FASTA files are indexed in memory, or once in a samtools style .fai file
+next to them if asked, which gives their record lengths and random access to their
+sequences in later runs.
+"""
+
+import bz2
+import csv
+import gzip
+import io
+import itertools as it
+import mmap
+import os
+import queue
+import re
+import threading
+
+import numpy as np
+
+from multiprocessing import Pool
+from bintable.bintable import table_format, read_binning_table
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+BLOCK_SIZE = 1 << 24
+CHUNK_SIZE = 1 << 26
+FASTA_INDEX_SUFFIX = ".fai"
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "bzip2": ".bz2", "zstd": ".zst"}
+
+_ASQG_VERTEX = re.compile(rb"\nVT\t(contig-(\d+))(?=\s|$)")
+_ASQG_EDGE = re.compile(rb"\nED\tcontig-(\d+) contig-(\d+)\s")
+_GFA_SEGMENT = re.compile(rb"\nS\t([^\t\n]+)\t([^\t\n]*)([^\n]*)")
+_GFA_LINK = re.compile(rb"\nL\t([^\t\n]+)\t([+-])\t([^\t\n]+)\t([+-])")
+_GFA_PATH = re.compile(rb"\nP\t([^\t\n]+)\t([^\t\n]+)")
+_GFA_LENGTH = re.compile(rb"\tLN:i:(\d+)")
+_SPADES_PATH_PART = re.compile(r"(NODE_\d+_length_\d+_cov_[\d.]+)_(\d+)")
+_FASTA_HEADER = re.compile(rb"\n>([^\n]*)")
+
+
+class _BackgroundReader(io.RawIOBase):
+    """Raw reader of a stream which is read ahead in a background thread.
+
+    Decompressors release the GIL, so the data is decompressed while the main thread
+    parses the data read before it."""
+
+    def __init__(self, stream, block_size=1 << 20, n_blocks=8):
+        self.stream = stream
+        self.block_size = block_size
+        self.blocks = queue.Queue(n_blocks)
+        self.block = memoryview(b"")
+        self.stopped = False
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _read_ahead(self):
+        try:
+            while not self.stopped:
+                data = self.stream.read(self.block_size)
+                self.blocks.put(data)
+                if not data:
+                    break
+        except Exception as error:
+            self.blocks.put(error)
+        finally:
+            self.stream.close()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.block) == 0:
+            if self.stopped:
+                return 0
+
+            data = self.blocks.get()
+
+            if isinstance(data, Exception):
+                raise data
+            if not data:
+                self.stopped = True
+                return 0
+
+            self.block = memoryview(data)
+
+        n = min(len(buffer), len(self.block))
+        buffer[:n] = self.block[:n]
+        self.block = self.block[n:]
+
+        return n
+
+    def close(self):
+        if not self.closed:
+            self.stopped = True
+
+            # Unblock the thread if it waits for space in the queue
+            try:
+                while True:
+                    self.blocks.get_nowait()
+            except queue.Empty:
+                pass
+
+            self.thread.join()
+
+        super().close()
+
+
+def compression(filename):
+    """Compression of a file ("gzip", "bzip2" or "zstd") told by its magic bytes, or None."""
+
+    with open(filename, "rb") as file:
+        magic = file.read(4)
+
+    if magic[:2] == b"\x1f\x8b":
+        return "gzip"
+    if magic[:3] == b"BZh":
+        return "bzip2"
+    if magic == b"\x28\xb5\x2f\xfd":
+        return "zstd"
+
+    return None
+
+
+def open_input(filename, mode="rb"):
+    """Open an input file for reading in binary ("rb") or text ("r") mode.
+
+    gzip, bzip2 and zstd compressed files are recognised by their magic bytes and are
+    decompressed in a background thread."""
+
+    kind = compression(filename)
+
+    if kind is None:
+        return open(filename, mode)
+
+    if kind == "gzip":
+        stream = gzip.open(filename, "rb")
+    elif kind == "bzip2":
+        stream = bz2.open(filename, "rb")
+    elif zstandard is None:
+        raise ImportError("Please install the zstandard package to read the zstd compressed file "+filename)
+    else:
+        stream = zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+
+    reader = io.BufferedReader(_BackgroundReader(stream), buffer_size=1 << 20)
+
+    if "b" in mode:
+        return reader
+
+    return io.TextIOWrapper(reader)
+
+
+def open_output(filename, kind=None):
+    """Open an output file for writing in binary mode, compressed with gzip, bzip2 or zstd if kind is given."""
+
+    if kind is None:
+        return open(filename, "wb")
+
+    if kind == "gzip":
+        return gzip.open(filename, "wb", compresslevel=6)
+    if kind == "bzip2":
+        return bz2.open(filename, "wb")
+    if kind == "zstd":
+        if zstandard is None:
+            raise ImportError("Please install the zstandard package to write the zstd compressed file "+filename)
+        return zstandard.ZstdCompressor().stream_writer(open(filename, "wb"), closefd=True)
+
+    raise ValueError("Unknown compression "+kind)
+
+
+def line_blocks(file, block_size=BLOCK_SIZE, keep=()):
+    """Blocks of whole lines of a binary file, each starting with a newline, and their cuts.
+
+    The middle of a line longer than a block (e.g. a record with a long sequence) is cut
+    out, so that only its head and its tail (e.g. the tags after the sequence) are kept.
+    Lines starting with one of the keep tags (e.g. P records, which are parsed whole) are
+    never cut; the block grows to hold them instead. Each block comes with its cut as a
+    (position, number of bytes cut out) pair, or None."""
+
+    keep = tuple(keep)
+
+    rest = b"\n"
+    cut_at = None
+    cut = 0
+
+    while True:
+        block = file.read(block_size)
+
+        if not block:
+            break
+
+        end = block.rfind(b"\n")
+
+        if end < 0:
+            # The line in rest goes on; keep its head and only the last block of its tail
+            if cut_at is None:
+                if len(rest) >= block_size and not (keep and rest.startswith(keep, 1)):
+                    cut_at = len(rest)
+            else:
+                cut += len(rest) - cut_at
+                rest = rest[:cut_at]
+            rest += block
+            continue
+
+        yield rest + block[:end], (cut_at, cut) if cut > 0 else None
+
+        rest = block[end:]
+        cut_at = None
+        cut = 0
+
+    if rest != b"\n":
+        yield rest, (cut_at, cut) if cut > 0 else None
+
+
+def _count_tagged(block, tag):
+    """Number of lines of a block which start with tag."""
+    return block.count(b"\n" + tag)
+
+
+def _parse_ints(groups):
+    """Integer array of all the digit strings of the regex matches of a block."""
+    return np.fromstring(b" ".join(it.chain.from_iterable(groups)), dtype=np.int64, sep=" ")
+
+
+def read_asqg(filename, block_size=BLOCK_SIZE):
+    """Contig names, contig numbers and links (pairs of contig numbers) of an SGA .asqg file."""
+
+    names = []
+    numbers = []
+    links = []
+
+    with open_input(filename) as file:
+        for block, _ in line_blocks(file, block_size):
+
+            vertices = _ASQG_VERTEX.findall(block)
+            edges = _ASQG_EDGE.findall(block)
+
+            if len(vertices) != _count_tagged(block, b"VT\t") or len(edges) != _count_tagged(block, b"ED\t"):
+                raise ValueError("Malformed VT or ED record in "+filename)
+
+            for name, number in vertices:
+                names.append(name.decode())
+                numbers.append(int(number))
+
+            if len(edges) > 0:
+                links.append(_parse_ints(edges))
+
+    if len(links) == 0:
+        return names, numbers, np.empty((0, 2), dtype=np.int64)
+
+    return names, numbers, np.concatenate(links).reshape(-1, 2)
+
+
+def read_gfa(filename, block_size=BLOCK_SIZE):
+    """Segment names, segment lengths, links and paths of a GFA file.
+
+    Links are (segment, orientation, segment, orientation) tuples and paths are (name,
+    list of oriented segments such as "12+") pairs of the P lines, if there are any.
+    Lengths are taken from the LN tags of the segments, or else from the lengths of
+    their sequences, which are measured without being read into memory. The length of
+    a segment without both (sequence "*" and no LN tag) is -1. P lines are read whole,
+    however long they are."""
+
+    segments = []
+    lengths = []
+    links = []
+    paths = []
+
+    with open_input(filename) as file:
+        for block, cut in line_blocks(file, block_size, keep=(b"P\t",)):
+
+            n_segments = len(segments)
+            n_links = len(links)
+            n_paths = len(paths)
+
+            for segment in _GFA_SEGMENT.finditer(block):
+                segments.append(segment.group(1).decode())
+
+                length = _GFA_LENGTH.search(segment.group(3))
+
+                if length is not None:
+                    lengths.append(int(length.group(1)))
+                elif segment.end(2) - segment.start(2) == 1 and block[segment.start(2)] == ord("*"):
+                    lengths.append(-1)
+                else:
+                    length = segment.end(2) - segment.start(2)
+                    if cut is not None and segment.start(2) <= cut[0] <= segment.end(2):
+                        length += cut[1]
+                    lengths.append(length)
+
+            links.extend(tuple(field.decode() for field in link) for link in _GFA_LINK.findall(block))
+
+            for path in _GFA_PATH.finditer(block):
+                paths.append((path.group(1).decode(), path.group(2).decode().split(",")))
+
+            if len(segments) - n_segments != _count_tagged(block, b"S\t") or len(links) - n_links != _count_tagged(block, b"L\t") \
+                    or len(paths) - n_paths != _count_tagged(block, b"P\t"):
+                raise ValueError("Malformed S, L or P record in "+filename)
+
+    return segments, lengths, links, paths
+
+
+def read_contig_paths(filename):
+    """Contig names and their paths (lists of oriented segments) of a SPAdes contigs.paths file.
+
+    The parts of a path which are split at gaps (lines ending with ";") are joined."""
+
+    with open_input(filename, "r") as file:
+        name = file.readline()
+        path = file.readline()
+
+        while name != "" and path != "":
+
+            while ";" in path:
+                path = path[:-2]+","+file.readline()
+
+            yield name.strip(), path.rstrip().split(",")
+
+            name = file.readline()
+            path = file.readline()
+
+
+def read_abundance(filename):
+    """Contig names and coverages of a tab separated abundance file."""
+
+    rows = []
+
+    with open_input(filename, "r") as file:
+        for line in file:
+            strings = line.split("\t")
+            rows.append((strings[0], int(strings[1])))
+
+    return rows
+
+
+def _ranked_bins(labels, values):
+    """Bin numbers of values and bin labels, with bins numbered in the order of their labels.
+
+    labels[values[i]] is the label of row i (a label may appear more than once). Bins are
+    numbered 0..n-1 in numeric order of their labels if all labels are integers, otherwise
+    in string order, so that bin k of a binning with bins 1..n is labelled k+1."""
+
+    used = np.unique(values).tolist()
+    used_labels = set(labels[value] for value in used)
+
+    try:
+        bin_labels = sorted(used_labels, key=int)
+    except ValueError:
+        bin_labels = sorted(used_labels)
+
+    bin_numbers = {label: k for k, label in enumerate(bin_labels)}
+
+    rank = np.zeros(len(labels), dtype=np.int64)
+    for value in used:
+        rank[value] = bin_numbers[labels[value]]
+
+    return rank[values], bin_labels
+
+
+def read_binning(filename, delimiter=","):
+    """Contig names, bin numbers and bin labels of a binning result file, read in one pass.
+
+    The file is a delimiter separated text file (possibly compressed) or an Arrow IPC or
+    Parquet table (see bintable). Bin labels can be any strings and bins are numbered
+    0..n-1 in the order of their labels (see _ranked_bins). Returns (names, numbers
+    ndarray, labels)."""
+
+    if table_format(filename) is not None:
+        names, values, labels = read_binning_table(filename)
+        numbers, bin_labels = _ranked_bins(labels, values)
+
+        return names, numbers, bin_labels
+
+    names = []
+    values = []
+    label_values = {}
+
+    with open_input(filename, "r") as file:
+        for row in csv.reader(file, delimiter=delimiter):
+            names.append(row[0])
+            values.append(label_values.setdefault(row[1], len(label_values)))
+
+    numbers, bin_labels = _ranked_bins(list(label_values), np.asarray(values, dtype=np.int64))
+
+    return names, numbers, bin_labels
+
+
+def spades_contig_paths(gfa_paths):
+    """Contig names and their paths of the P lines of a SPAdes GFA file, as in contigs.paths.
+
+    SPAdes writes the parts of a scaffold between gaps as paths named <contig>_1,
+    <contig>_2, ..., which are joined again. Each contig path is followed by its reverse
+    complement path, named <contig>', as in contigs.paths. The reverse path is taken from
+    the P lines if they have it (<contig>' or <contig>_1', ...) and made otherwise."""
+
+    contigs = {}
+
+    for name, segments in gfa_paths:
+        reverse = name.endswith("'")
+
+        if reverse:
+            name = name[:-1]
+
+        part = _SPADES_PATH_PART.fullmatch(name)
+
+        if part is not None:
+            name = part.group(1)
+
+        contigs.setdefault(name+("'" if reverse else ""), []).extend(segments)
+
+    for name, segments in contigs.items():
+        if name.endswith("'"):
+            # Reverse paths are written after their contig paths
+            if name[:-1] not in contigs:
+                yield name, segments
+            continue
+
+        yield name, segments
+
+        if name+"'" in contigs:
+            yield name+"'", contigs[name+"'"]
+        else:
+            yield name+"'", [segment[:-1]+("-" if segment.endswith("+") else "+") for segment in reversed(segments)]
+
+
+def _sequence_bytes(data, start, end):
+    """Number of bytes between two offsets of a FASTA file which are not line breaks or spaces."""
+
+    block = np.frombuffer(data, dtype=np.uint8, count=end-start, offset=start)
+
+    n_bytes = len(block) - np.count_nonzero(block == ord("\n"))
+
+    # Carriage returns and spaces are rare, so look for them before counting them
+    for space in (b"\r", b" "):
+        if data.find(space, start, end) >= 0:
+            n_bytes -= np.count_nonzero(block == ord(space))
+
+    return n_bytes
+
+
+def _next_record(data, start, end):
+    """Offset of the first record header of a FASTA file between two offsets, or end if there is none."""
+
+    # A single byte is searched much faster than a newline followed by ">"
+    pos = data.find(b">", start, end)
+
+    while pos > 0 and data[pos-1] != ord("\n"):
+        pos = data.find(b">", pos+1, end)
+
+    return end if pos < 0 else pos
+
+
+def _line_widths(data, start, end):
+    """Number of bases and of bytes (with the line break) of the first sequence line of a FASTA record."""
+
+    line_end = data.find(b"\n", start, end)
+
+    if line_end < 0:
+        line_bytes = end - start
+        line_end = end
+    else:
+        line_bytes = line_end + 1 - start
+
+    line_bases = line_end - start
+
+    if line_bases > 0 and data[line_end-1] == ord("\r"):
+        line_bases -= 1
+
+    return line_bases, line_bytes
+
+
+def _full_lines_even(data, start, full_lines, line_bytes):
+    """Whether each of full_lines lines from an offset of a FASTA file ends with a line break after line_bytes bytes."""
+
+    if full_lines == 0:
+        return True
+
+    block = np.frombuffer(data, dtype=np.uint8, count=full_lines*line_bytes, offset=start)
+
+    return bool(np.all(block[line_bytes-1::line_bytes] == ord("\n")))
+
+
+def _fasta_chunk_index(task):
+    """Names, sequence lengths, sequence offsets and line widths of the FASTA records between two offsets of a file.
+
+    Records whose sequence lines (but the last) are not all of the same width are marked as uneven."""
+
+    filename, start, end, block_size = task
+
+    columns = ([], [], [], [], [], [])
+    names, lengths, offsets, all_line_bases, all_line_bytes, uneven = columns
+
+    with open(filename, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+        pos = start
+
+        while pos < end:
+            header_end = data.find(b"\n", pos, end)
+            if header_end < 0:
+                header_end = end
+
+            header = data[pos+1:header_end].split(None, 1)
+            names.append(header[0].decode() if len(header) > 0 else "")
+
+            offset = min(header_end + 1, end)
+            next_record = _next_record(data, header_end, end)
+
+            length = 0
+
+            for block_start in range(offset, next_record, block_size):
+                length += _sequence_bytes(data, block_start, min(block_start + block_size, next_record))
+
+            line_bases, line_bytes = _line_widths(data, offset, next_record)
+
+            # All lines but the last take line_bytes bytes, the last one may or may not end with a line break
+            if line_bases > 0:
+                lines_before_last = (length - 1) // line_bases
+                span = lines_before_last * line_bytes + length - lines_before_last * line_bases
+                even = (next_record - offset in (span, span + line_bytes - line_bases)
+                        and _full_lines_even(data, offset, lines_before_last, line_bytes))
+            else:
+                even = length == 0
+
+            lengths.append(length)
+            offsets.append(offset)
+            all_line_bases.append(line_bases)
+            all_line_bytes.append(line_bytes)
+            uneven.append(not even)
+
+            pos = next_record
+
+    return columns
+
+
+def _sequence_bytes_of_block(block, start, end, cut):
+    """Number of bytes between two offsets of a block of a FASTA file which are not line breaks or spaces."""
+
+    n_bytes = end - start - block.count(b"\n", start, end)
+
+    for space in (b"\r", b" "):
+        if block.find(space, start, end) >= 0:
+            n_bytes -= block.count(space, start, end)
+
+    if cut is not None and start <= cut[0] <= end:
+        n_bytes += cut[1]
+
+    return n_bytes
+
+
+def _fasta_stream_lengths(filename, block_size):
+    """Names and sequence lengths of the FASTA records of a file which cannot be memory-mapped."""
+
+    names = []
+    lengths = []
+    length = None
+
+    with open_input(filename) as file:
+        for block, cut in line_blocks(file, block_size):
+
+            pos = 0
+
+            for header in _FASTA_HEADER.finditer(block):
+                if length is not None:
+                    lengths.append(length + _sequence_bytes_of_block(block, pos, header.start(), cut))
+
+                fields = header.group(1).split(None, 1)
+                names.append(fields[0].decode() if len(fields) > 0 else "")
+
+                pos = header.end()
+                length = 0
+
+            if length is not None:
+                length += _sequence_bytes_of_block(block, pos, len(block), cut)
+
+    if length is not None:
+        lengths.append(length)
+
+    return names, np.array(lengths, dtype=np.int64)
+
+
+class FastaIndex:
+    """Name, sequence length, sequence offset and line widths of each record of a FASTA file.
+
+    These are the columns of a samtools .fai index: the sequence of record i starts at
+    byte offsets[i] of the file and each of its lines (but the last) has line_bases[i]
+    bases in line_bytes[i] bytes. Records whose lines are of different widths cannot be
+    read through the index; they are marked in uneven and the index is not written."""
+
+    def __init__(self, names, lengths, offsets, line_bases, line_bytes, uneven=None):
+        self.names = names
+        self.lengths = np.asarray(lengths, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.line_bases = np.asarray(line_bases, dtype=np.int64)
+        self.line_bytes = np.asarray(line_bytes, dtype=np.int64)
+        self.uneven = np.zeros(len(names), dtype=bool) if uneven is None else np.asarray(uneven, dtype=bool)
+
+    def __len__(self):
+        return len(self.names)
+
+    def span(self, i):
+        """Number of bytes from the first to the last base of record i, with the line breaks between."""
+
+        length, line_bases, line_bytes = int(self.lengths[i]), int(self.line_bases[i]), int(self.line_bytes[i])
+
+        if length == 0:
+            return 0
+
+        lines_before_last = (length - 1) // line_bases
+
+        return lines_before_last * line_bytes + length - lines_before_last * line_bases
+
+    def record_bounds(self, data, i):
+        """Start of the header line and end of the last base of record i in the data (e.g. the mmap) of the FASTA file."""
+
+        offset = int(self.offsets[i])
+        start = data.rfind(b"\n", 0, offset - 1) + 1
+
+        if not self.uneven[i]:
+            return start, offset + self.span(i)
+
+        end = _next_record(data, offset, len(data))
+
+        while end > offset and data[end-1] in b"\r\n":
+            end -= 1
+
+        return start, end
+
+    def sequence(self, file, i):
+        """Sequence of record i (bytes) read from the open FASTA file."""
+
+        if self.uneven[i]:
+            raise ValueError("Lines of different widths in FASTA record " + self.names[i])
+
+        file.seek(int(self.offsets[i]))
+
+        return file.read(self.span(i)).replace(b"\n", b"").replace(b"\r", b"")
+
+    def write(self, filename):
+        """Write the index to a .fai file. The file is replaced at once, so that readers never see a part of it."""
+
+        if self.uneven.any():
+            raise ValueError("Lines of different widths in FASTA record " + self.names[int(np.argmax(self.uneven))])
+
+        temp_filename = filename + "." + str(os.getpid()) + ".tmp"
+
+        with open(temp_filename, "w") as file:
+            for i in range(len(self)):
+                file.write("%s\t%d\t%d\t%d\t%d\n" % (self.names[i], self.lengths[i], self.offsets[i], self.line_bases[i], self.line_bytes[i]))
+
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def read(cls, filename):
+        """Index read from a .fai file."""
+
+        names = []
+        columns = []
+
+        with open(filename) as file:
+            for line in file:
+                fields = line.rstrip("\n").split("\t")
+                names.append(fields[0])
+                columns.append([int(x) for x in fields[1:5]])
+
+        columns = np.array(columns, dtype=np.int64).reshape(-1, 4)
+
+        return cls(names, columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3])
+
+
+def read_fasta_index(filename):
+    """Index of a FASTA file read from its .fai file, or None if there is no .fai file or it is out of date.
+
+    The index is out of date if it is older than the FASTA file or if its last record
+    does not end at the end of the file (up to a final line break)."""
+
+    index_filename = filename + FASTA_INDEX_SUFFIX
+
+    try:
+        if os.path.getmtime(index_filename) < os.path.getmtime(filename):
+            return None
+
+        index = FastaIndex.read(index_filename)
+        size = os.path.getsize(filename)
+
+        if len(index) == 0:
+            return index if size == 0 else None
+
+        # A .fai file of another version of the FASTA file ends elsewhere
+        if not 0 <= size - (index.offsets[-1] + index.span(len(index)-1)) <= 2:
+            return None
+
+        return index
+
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def index_fasta(filename, nthreads=1, chunk_size=CHUNK_SIZE, block_size=BLOCK_SIZE):
+    """Index of all the records of an uncompressed FASTA file.
+
+    The memory-mapped file is split at record boundaries into chunks of about chunk_size
+    bytes, which are scanned by a pool of nthreads processes. Sequences are never parsed,
+    only their line breaks are counted."""
+
+    with open(filename, "rb") as file:
+        size = os.fstat(file.fileno()).st_size
+
+        if size == 0:
+            return FastaIndex([], [], [], [], [])
+
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+
+            # Skip anything before the first record
+            bounds = [_next_record(data, 0, size)]
+
+            for offset in range(bounds[0] + chunk_size, size, chunk_size):
+                boundary = _next_record(data, max(offset, bounds[-1] + 1), size)
+                if boundary >= size:
+                    break
+                bounds.append(boundary)
+
+            bounds.append(size)
+
+    tasks = [(filename, bounds[k], bounds[k+1], block_size) for k in range(len(bounds)-1)]
+
+    if nthreads > 1 and len(tasks) > 1:
+        with Pool(min(nthreads, len(tasks))) as p:
+            chunks = p.map(_fasta_chunk_index, tasks)
+    else:
+        chunks = [_fasta_chunk_index(task) for task in tasks]
+
+    columns = [list(it.chain.from_iterable(chunk[k] for chunk in chunks)) for k in range(6)]
+
+    return FastaIndex(*columns)
+
+
+def fasta_index(filename, nthreads=1, chunk_size=CHUNK_SIZE, block_size=BLOCK_SIZE, write_index=False):
+    """Index of an uncompressed FASTA file, read from its .fai file if it is up to date.
+
+    Otherwise the file is indexed. With write_index the index is written to the .fai file,
+    unless the folder cannot be written or a record has lines of different widths."""
+
+    index = read_fasta_index(filename)
+
+    if index is None:
+        index = index_fasta(filename, nthreads, chunk_size, block_size)
+
+        if write_index:
+            try:
+                index.write(filename + FASTA_INDEX_SUFFIX)
+            except (OSError, ValueError):
+                pass
+
+    return index
+
+
+def fasta_lengths(filename, nthreads=1, chunk_size=CHUNK_SIZE, block_size=BLOCK_SIZE, write_index=False):
+    """Names (record ids) and sequence lengths of all the records of a FASTA file.
+
+    Uncompressed files are taken from their index, which is read from an up to date .fai
+    file or else built (and written with write_index, see fasta_index). Compressed files
+    are scanned as a stream."""
+
+    if compression(filename) is not None:
+        return _fasta_stream_lengths(filename, block_size)
+
+    index = fasta_index(filename, nthreads, chunk_size, block_size, write_index)
+
+    return index.names, index.lengths
@@ -6,6 +6,8 @@ https://stackoverflow.com/questions/3318625/how-to-implement-an-efficient-bidire
 answered by user jme
 """
 
+import numpy as np
+
 class BidirectionalError(Exception):
     """Must set a unique value in a BijectiveMap."""
 
@@ -38,4 +40,116 @@ class BidirectionalMap(dict):
         super().__delitem__(key)
 
     def _set_item(self, key, value):
-        super().__setitem__(key, value)
\ No newline at end of file
+        super().__setitem__(key, value)
+
+class _DenseIndex:
+    """Map of integer keys to non-negative integers stored in an array indexed by key.
+
+    Keys beyond sparse_factor times the number of entries (or negative keys and values)
+    are kept in a dict instead, so that sparse ids do not blow up the array."""
+
+    def __init__(self, sparse_factor):
+        self.sparse_factor = sparse_factor
+        self.array = np.full(16, -1, dtype=np.int64)
+        self.sparse = {}
+        self.size = 0
+
+    def __getitem__(self, key):
+        if 0 <= key < len(self.array):
+            value = self.array.item(key)
+            if value >= 0:
+                return value
+        return self.sparse[key]
+
+    def __contains__(self, key):
+        if 0 <= key < len(self.array) and self.array.item(key) >= 0:
+            return True
+        return key in self.sparse
+
+    def _set_item(self, key, value):
+        limit = self.sparse_factor * (self.size + 1) + 1024
+
+        if 0 <= key < limit and value >= 0:
+            if key >= len(self.array):
+                array = np.full(min(max(2 * len(self.array), key + 1), limit), -1, dtype=np.int64)
+                array[:len(self.array)] = self.array
+                self.array = array
+            self.array[key] = value
+        else:
+            self.sparse[key] = value
+
+        self.size += 1
+
+    def _del_item(self, key):
+        if 0 <= key < len(self.array) and self.array.item(key) >= 0:
+            self.array[key] = -1
+        else:
+            del self.sparse[key]
+
+        self.size -= 1
+
+    def translate(self, keys, default=None):
+        """Look up a whole array of keys at once.
+
+        Missing keys raise a KeyError, unless a default is given which is used for them instead."""
+
+        keys = np.asarray(keys, dtype=np.int64)
+        values = np.full(keys.shape, -1, dtype=np.int64)
+
+        in_array = (keys >= 0) & (keys < len(self.array))
+        values[in_array] = self.array[keys[in_array]]
+
+        missing = values < 0
+
+        for index in zip(*np.nonzero(missing)):
+            key = keys[index].item()
+            if key in self.sparse:
+                values[index] = self.sparse[key]
+                missing[index] = False
+
+        if missing.any():
+            if default is None:
+                raise KeyError(keys[missing][0].item())
+            values[missing] = default
+
+        return values
+
+    def __len__(self):
+        return self.size
+
+    def keys(self):
+        return np.nonzero(self.array >= 0)[0].tolist() + list(self.sparse.keys())
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
+class DenseBidirectionalMap(_DenseIndex):
+    """Invertible map between near-dense integer ids (e.g. node ids and contig numbers).
+
+    Both directions are integer arrays with a dict fallback for sparse ids, and whole
+    arrays of ids can be translated at once with translate() and inverse.translate()."""
+
+    def __init__(self, inverse=None, sparse_factor=4):
+        super().__init__(sparse_factor)
+        if inverse is None:
+            inverse = self.__class__(inverse=self, sparse_factor=sparse_factor)
+        self.inverse = inverse
+
+    def __setitem__(self, key, value):
+        if value in self.inverse:
+            raise BidirectionalError(value)
+
+        if key in self:
+            self.inverse._del_item(self[key])
+            self._del_item(key)
+
+        self.inverse._set_item(value, key)
+        self._set_item(key, value)
+
+    def __delitem__(self, key):
+        self.inverse._del_item(self[key])
+        self._del_item(key)
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""
+Per-bin FASTA files of the final binning result.
+
+Contig records are copied from the memory-mapped contigs file at the offsets of its
+.fai index, without parsing their sequences. Bins are written through a bounded pool
+of open files, so that neither the memory nor the number of open files grows with the
+number of bins or the size of the assembly.
+"""
+
+import mmap
+import re
+
+from collections import OrderedDict
+
+from assemblyio.assemblyio import compression, fasta_index
+
+MAX_OPEN_FILES = 64
+
+_UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class HandlePool:
+    """Output files of which at most max_open are kept open.
+
+    When another file has to be opened, the least recently written one is closed and is
+    appended to when it is written again. A file is truncated the first time it is opened."""
+
+    def __init__(self, max_open=MAX_OPEN_FILES):
+        self.max_open = max_open
+        self.handles = OrderedDict()
+        self.opened = set()
+
+    def write(self, filename, data):
+        handle = self.handles.get(filename)
+
+        if handle is None:
+            if len(self.handles) >= self.max_open:
+                _, oldest = self.handles.popitem(last=False)
+                oldest.close()
+
+            handle = open(filename, "ab" if filename in self.opened else "wb")
+            self.opened.add(filename)
+            self.handles[filename] = handle
+        else:
+            self.handles.move_to_end(filename)
+
+        handle.write(data)
+
+    def close(self):
+        while self.handles:
+            _, handle = self.handles.popitem()
+            handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def bin_fasta_filenames(path, labels):
+    """FASTA file of each bin (path/bin_<label>.fasta) with characters other than letters,
+    digits, ".", "_" and "-" of the labels replaced by "_". Labels which become the same
+    name get the bin index appended."""
+
+    filenames = []
+    used = set()
+
+    for k, label in enumerate(labels):
+        name = "bin_" + _UNSAFE_FILENAME_CHARS.sub("_", str(label))
+
+        if name in used:
+            name += "_" + str(k)
+
+        used.add(name)
+        filenames.append(path + name + ".fasta")
+
+    return filenames
+
+
+def write_bin_fasta(contigs_file, bins, contig_names, filenames, nthreads=1, max_open=MAX_OPEN_FILES, write_index=False):
+    """Write the FASTA records of the contigs of each bin to the file of the bin.
+
+    bins are lists of node ids (a multi-binned contig is in each of its bins), contig_names
+    gives the record name of each node and filenames the output file of each bin. Records
+    are copied in the order of the contigs file. Bins without contigs get no file.
+    The contigs file is indexed unless it has an up to date .fai file, which is written
+    with write_index. Returns the number of records written."""
+
+    if compression(contigs_file) is not None:
+        raise ValueError("Per-bin FASTA files need an uncompressed contigs file")
+
+    index = fasta_index(contigs_file, nthreads, write_index=write_index)
+    records = {name: i for i, name in enumerate(index.names)}
+
+    # Bins of each record of the contigs file
+    record_bins = {}
+
+    for k, contigs in enumerate(bins):
+        for contig in contigs:
+            name = contig_names[contig]
+            record = records.get(name)
+
+            if record is None:
+                raise KeyError("Contig " + name + " is not in the contigs file")
+
+            record_bins.setdefault(record, []).append(k)
+
+    n_written = 0
+
+    if len(record_bins) == 0:
+        return n_written
+
+    with open(contigs_file, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data, \
+            HandlePool(max_open) as pool:
+
+        for record in sorted(record_bins):
+            start, end = index.record_bounds(data, record)
+            fasta_record = data[start:end].rstrip(b"\r\n") + b"\n"
+
+            for k in record_bins[record]:
+                pool.write(filenames[k], fasta_record)
+                n_written += 1
+
+    return n_written
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+
+"""
+Binning tables (contig, bin) and other result tables written as CSV, Arrow IPC or Parquet.
+
+Arrow IPC and Parquet need the optional pyarrow package. In their binning tables the
+contig column is dictionary-encoded (node ids as indices into the contig names) and the
+bin column is dictionary-encoded as well (bin numbers as indices into the bin labels),
+so the columns are integer arrays which other tools can map without parsing text.
+
+The final binning can also be written in the CAMI biobox binning format (e.g. for AMBER)
+in the same pass over its rows.
+"""
+
+import csv
+
+import numpy as np
+
+from collections import namedtuple
+from contextlib import nullcontext
+
+from nametable.nametable import NameTable
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pa = None
+
+OUTPUT_FORMATS = {"csv": ".csv", "arrow": ".arrow", "parquet": ".parquet"}
+
+BIOBOX_VERSION = "0.9.1"
+
+# Biobox output of a binning: file name, sample id, whether to strip contig names and whether to write a contig in one bin only
+Biobox = namedtuple("Biobox", ["filename", "sample_id", "strip", "unique"])
+
+PARQUET_MAGIC = b"PAR1"
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+
+
+def arrow_available():
+    return pa is not None
+
+
+def table_format(filename):
+    """Format of a table file ("parquet" or "arrow") from its first bytes, or None for text files."""
+
+    with open(filename, "rb") as file:
+        magic = file.read(6)
+
+    if magic.startswith(PARQUET_MAGIC):
+        return "parquet"
+
+    if magic.startswith(ARROW_FILE_MAGIC) or magic.startswith(ARROW_STREAM_MAGIC):
+        return "arrow"
+
+    return None
+
+
+def _require_arrow():
+    if pa is None:
+        raise ImportError("Arrow IPC and Parquet tables need the pyarrow package (pip install pyarrow)")
+
+
+def _name_dictionary(contig_names):
+    """Contig names as an Arrow string array sharing the buffers of a NameTable."""
+
+    return pa.LargeStringArray.from_buffers(len(contig_names), pa.py_buffer(contig_names.offsets),
+                                           pa.py_buffer(contig_names.buffer))
+
+
+def binning_table(nodes, bin_numbers, contig_names, bin_labels):
+    """Arrow table of binning rows (contig name of nodes[i], bin label of bin_numbers[i])."""
+
+    _require_arrow()
+
+    nodes = np.asarray(nodes, dtype=np.int64)
+    bin_numbers = np.asarray(bin_numbers, dtype=np.int32)
+
+    if isinstance(contig_names, NameTable):
+        contigs = pa.DictionaryArray.from_arrays(pa.array(nodes.astype(np.int32)), _name_dictionary(contig_names))
+    else:
+        contigs = pa.array([contig_names[i] for i in nodes.tolist()])
+
+    bins = pa.DictionaryArray.from_arrays(pa.array(bin_numbers), pa.array([str(label) for label in bin_labels], type=pa.string()))
+
+    return pa.table({"contig": contigs, "bin": bins})
+
+
+def write_table(table, filename, output_format):
+    """Write an Arrow table (or a pandas data frame) as an Arrow IPC file or a Parquet file."""
+
+    _require_arrow()
+
+    if not isinstance(table, pa.Table):
+        table = pa.Table.from_pandas(table, preserve_index=False)
+
+    if output_format == "parquet":
+        pyarrow.parquet.write_table(table, filename)
+    else:
+        with pa.OSFile(filename, "wb") as sink, pyarrow.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def strip_contig_name(name):
+    """SPAdes-like contig name (NODE_1234_length_567_cov_8.991) stripped to NODE_1234."""
+    return "_".join(name.split("_")[:2])
+
+
+class BioboxWriter:
+    """Writer of binning rows in the CAMI biobox binning format.
+
+    Bins are renumbered 1..n in the order of their bin numbers, counting only the bins
+    which get rows. With unique, a contig is written in the first of its bins only, which
+    needs the rows of a contig to be next to each other (as in graphbin2_output). With
+    strip, SPAdes-like contig names are shortened to NODE_<n>."""
+
+    def __init__(self, file, nodes, bin_numbers, sample_id="Sample", strip=False, unique=False):
+        self.file = file
+        self.strip = strip
+        self.unique = unique
+        self.last_node = None
+
+        nodes = np.asarray(nodes, dtype=np.int64)
+        bin_numbers = np.asarray(bin_numbers, dtype=np.int64)
+
+        if unique:
+            bin_numbers = bin_numbers[np.r_[True, nodes[1:] != nodes[:-1]]] if len(nodes) > 0 else bin_numbers
+
+        self.bin_ids = {bin_number: k+1 for k, bin_number in enumerate(np.unique(bin_numbers).tolist())}
+
+        self.file.write("@Version:" + BIOBOX_VERSION + "\n@SampleID:" + sample_id + "\n@@SEQUENCEID\tBINID\n")
+
+    def writerow(self, node, name, bin_number):
+        if self.unique and node == self.last_node:
+            return
+
+        self.last_node = node
+
+        self.file.write((strip_contig_name(name) if self.strip else name) + "\t" + str(self.bin_ids[bin_number]) + "\n")
+
+
+def write_binning(filename, nodes, bin_numbers, contig_names, bin_labels, output_format="csv", delimiter=",", biobox=None):
+    """Write binning rows (contig name of nodes[i], bin label of bin_numbers[i]) to a file of the format.
+
+    If biobox (a Biobox) is given, the rows are also written in the biobox format, in the
+    same pass over the rows as the CSV file."""
+
+    if output_format != "csv":
+        write_table(binning_table(nodes, bin_numbers, contig_names, bin_labels), filename, output_format)
+
+        if biobox is None:
+            return
+
+    with open(filename, mode='w') if output_format == "csv" else nullcontext() as output_file, \
+            open(biobox.filename, mode='w') if biobox is not None else nullcontext() as biobox_file:
+
+        output_writer = None
+        biobox_writer = None
+
+        if output_file is not None:
+            output_writer = csv.writer(output_file, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+
+        if biobox_file is not None:
+            biobox_writer = BioboxWriter(biobox_file, nodes, bin_numbers, biobox.sample_id, biobox.strip, biobox.unique)
+
+        for node, bin_number in zip(nodes, bin_numbers):
+            name = contig_names[node]
+
+            if output_writer is not None:
+                output_writer.writerow([name, bin_labels[bin_number]])
+
+            if biobox_writer is not None:
+                biobox_writer.writerow(node, name, bin_number)
+
+
+def write_frame(df, filename, output_format="csv", sep="\t"):
+    """Write a pandas data frame to a file of the format."""
+
+    if output_format == "csv":
+        df.to_csv(filename, index=False, sep=sep)
+    else:
+        write_table(df, filename, output_format)
+
+
+def read_binning_table(filename):
+    """Contig names, bin values and bin labels of an Arrow IPC or Parquet binning table.
+
+    The contig and bin columns are taken by name ("contig" and "bin") or else as the first
+    two columns. The bin column may be dictionary-encoded or hold plain values. Returns
+    (names, values ndarray, labels) where labels[values[i]] is the bin label of row i."""
+
+    _require_arrow()
+
+    if table_format(filename) == "parquet":
+        table = pyarrow.parquet.read_table(filename)
+    else:
+        with pa.memory_map(filename) as source:
+            try:
+                table = pyarrow.ipc.open_file(source).read_all()
+            except pa.ArrowInvalid:
+                source.seek(0)
+                table = pyarrow.ipc.open_stream(source).read_all()
+
+    table = table.unify_dictionaries()
+
+    names = table.column_names
+    contigs = table.column("contig") if "contig" in names else table.column(0)
+    bins = (table.column("bin") if "bin" in names else table.column(1)).combine_chunks()
+
+    if pa.types.is_dictionary(bins.type):
+        labels = [str(label) for label in bins.dictionary.to_pylist()]
+        numbers = bins.indices.to_numpy(zero_copy_only=False).astype(np.int64)
+    else:
+        values, numbers = np.unique(bins.to_numpy(zero_copy_only=False), return_inverse=True)
+        labels = [str(value) for value in values.tolist()]
+
+    return contigs.to_pylist(), numbers, labels
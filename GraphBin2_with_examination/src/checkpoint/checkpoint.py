@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Stage checkpoints of the GraphBin2 pipeline, used to resume a run after a crash.
+
+Checkpoints are opt-in. When enabled, the state of the labelling stages is written
+after each stage and, within long stages, at most every `interval` seconds. Lists of node ids are stored as NumPy
+arrays (lists of lists such as the bins as one array with offsets) to keep the
+checkpoint compact.
+"""
+
+import os
+import pickle
+import time
+
+import numpy as np
+
+
+STAGES = ["removal", "refinement", "component_detection", "propagation", "multi_bin"]
+
+
+class CheckpointError(Exception):
+    """The checkpoint cannot be used to resume this run."""
+
+
+def input_signature(filename):
+    """Path, size and modification time of an input file, which tell whether it changed since a checkpoint."""
+
+    if not os.path.isfile(filename):
+        return (os.path.abspath(filename), None, None)
+
+    stat = os.stat(filename)
+
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+def _is_int(value):
+    return isinstance(value, (int, np.integer)) and not isinstance(value, bool)
+
+
+def _pack(value):
+    """Store lists of ints, lists of int tuples and lists of int lists as arrays."""
+
+    if not isinstance(value, list):
+        return value
+
+    if all(_is_int(x) for x in value):
+        return ("ints", np.array(value, dtype=np.int64))
+
+    if all(isinstance(x, tuple) and all(_is_int(y) for y in x) for x in value) and len(set(len(x) for x in value)) == 1:
+        return ("tuples", np.array(value, dtype=np.int64))
+
+    if all(isinstance(x, list) and all(_is_int(y) for y in x) for x in value):
+        offsets = np.cumsum([0] + [len(x) for x in value])
+        return ("lists", np.array([y for x in value for y in x], dtype=np.int64), offsets)
+
+    return value
+
+
+def _unpack(value):
+    if not isinstance(value, tuple) or len(value) == 0 or value[0] not in ("ints", "tuples", "lists"):
+        return value
+
+    if value[0] == "ints":
+        return value[1].tolist()
+
+    if value[0] == "tuples":
+        return [tuple(x) for x in value[1].tolist()]
+
+    values, offsets = value[1].tolist(), value[2].tolist()
+    return [values[offsets[i]:offsets[i+1]] for i in range(len(offsets)-1)]
+
+
+class Checkpoint:
+    """Checkpoint file of a run and the stage it resumes from.
+
+    params (e.g. assembler, number of contigs and bins, depth and threshold) and the
+    signatures of the input files are written with every checkpoint and must match when
+    the run is resumed. Unless enabled, no checkpoint is written."""
+
+    def __init__(self, filename, interval=0, enabled=True, inputs=(), **params):
+        self.filename = filename
+        self.interval = interval
+        self.enabled = enabled
+        self.params = dict(params, inputs=[input_signature(x) for x in inputs])
+        self.stage = None
+        self.done = False
+        self.last_save = time.time()
+
+    def _position(self, stage, done):
+        return 2 * STAGES.index(stage) + (1 if done else 0)
+
+    def load(self):
+        """Load the state of the checkpoint file, or an empty state if there is none."""
+
+        if not os.path.isfile(self.filename):
+            return {}
+
+        try:
+            with open(self.filename, "rb") as checkpoint_file:
+                checkpoint = pickle.load(checkpoint_file)
+        except Exception as e:
+            raise CheckpointError("Failed to read the checkpoint file "+self.filename+": "+str(e))
+
+        if checkpoint["params"] != self.params:
+            raise CheckpointError("The checkpoint file "+self.filename+" was written for other inputs or parameters: "+str(checkpoint["params"]))
+
+        self.stage = checkpoint["stage"]
+        self.done = checkpoint["done"]
+
+        return {name: _unpack(value) for name, value in checkpoint["state"].items()}
+
+    def skip(self, stage):
+        """Whether the resumed checkpoint was written after the stage finished."""
+        return self.stage is not None and self._position(self.stage, self.done) >= self._position(stage, True)
+
+    def resumes(self, stage):
+        """Whether the resumed checkpoint was written within the stage."""
+        return self.stage == stage and not self.done
+
+    def due(self):
+        """Whether the interval for a checkpoint within a stage has passed."""
+        return self.enabled and self.interval > 0 and time.time() - self.last_save >= self.interval
+
+    def save(self, stage, done=False, **state):
+        """Write the state of a stage, unless the resumed checkpoint is already further on."""
+
+        if not self.enabled:
+            return
+
+        if self.stage is not None and self._position(stage, done) < self._position(self.stage, self.done):
+            return
+
+        checkpoint = {"stage": stage, "done": done, "params": self.params,
+                      "state": {name: _pack(value) for name, value in state.items()}}
+
+        # Write to a temporary file first so that a crash while writing keeps the last checkpoint
+        with open(self.filename+".tmp", "wb") as checkpoint_file:
+            pickle.dump(checkpoint, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(self.filename+".tmp", self.filename)
+
+        self.last_save = time.time()
+
+    def remove(self):
+        """Remove the checkpoint file after the run finished."""
+
+        if self.enabled and os.path.isfile(self.filename):
+            os.remove(self.filename)
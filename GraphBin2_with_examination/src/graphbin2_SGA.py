@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
 
 import sys
-import csv
+import os
 import time
 import argparse
 import re
 import heapq
 import itertools as it
 import logging
+import numpy as np
 
-from multiprocessing import Pool
-from Bio import SeqIO
+from multiprocessing import Pool, get_context
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from igraph import *
 from collections import defaultdict
-from bidirectionalmap.bidirectionalmap import BidirectionalMap
+from bidirectionalmap.bidirectionalmap import DenseBidirectionalMap
+from nametable.nametable import NameTable
+from assemblyio.assemblyio import read_asqg, fasta_lengths, open_input, read_abundance, read_binning
+from sweep.sweep import read_sweep_grid, fork_sweep, write_sweep_summary
+from metrics.metrics import StageMetrics
+from memprofile.memprofile import MemoryProfiler
+from tracer.tracer import Tracer
+from checkpoint.checkpoint import Checkpoint, CheckpointError
+from recheck.recheck import RecheckIndex
+from binfasta.binfasta import bin_fasta_filenames, write_bin_fasta
+from bintable.bintable import OUTPUT_FORMATS, Biobox, arrow_available, write_binning, write_frame
 from tqdm import tqdm
 
 
@@ -31,9 +42,23 @@ ap.add_argument("--binned", required=True, help="path to the .csv file with the
 ap.add_argument("--output", required=True, help="path to the output folder")
 ap.add_argument("--prefix", required=False, default='', help="prefix for the output file")
 ap.add_argument("--depth", required=False, type=int, default=5, help="maximum depth for the breadth-first-search. [default: 5]")
+ap.add_argument("--nearest_k", required=False, type=int, default=0, help="stop a breadth-first-search after the depth level at which k labelled contigs were found. 0 - search up to the maximum depth. [default: 0]")
 ap.add_argument("--threshold", required=False, type=float, default=1.5, help="threshold for determining inconsistent vertices. [default: 1.5]")
 ap.add_argument("--delimiter", required=False, type=str, default=",", help="delimiter for input/output results [default: , (comma)]")
 ap.add_argument("--nthreads", required=False, type=int, default=8, help="number of threads to use. [default: 8]")
+ap.add_argument("--memprofile", required=False, default=False, action="store_true", help="record peak memory and top allocations of each stage and sizes of the main structures")
+ap.add_argument("--trace", required=False, default=False, action="store_true", help="write a timeline of stages, iterations, worker tasks and file writes in trace-event format")
+ap.add_argument("--resume", required=False, default=False, action="store_true", help="continue from the last checkpoint in the output folder")
+ap.add_argument("--checkpoint", required=False, default=False, action="store_true", help="write checkpoints after each stage to resume the run with --resume")
+ap.add_argument("--checkpoint_interval", required=False, type=int, default=600, help="seconds between checkpoints within long stages. 0 - checkpoint only after each stage")
+ap.add_argument("--sweep", required=False, type=str, default="", help="path to a tab separated file with parameter sets (depth, threshold) to run on the same parsed graph")
+ap.add_argument("--fasta_index", required=False, default=False, action="store_true", help="write a .fai index of the contigs file next to it, which later runs read instead of scanning the file")
+ap.add_argument("--bin_fasta", required=False, default=False, action="store_true", help="write a FASTA file of the contigs of each bin to the bins folder of the output")
+ap.add_argument("--output_format", required=False, type=str, default="csv", choices=list(OUTPUT_FORMATS), help="format of the binning outputs: csv, arrow (Arrow IPC) or parquet (both need pyarrow). [default: csv]")
+ap.add_argument("--biobox", required=False, default=False, action="store_true", help="also write the final binning in the CAMI biobox format (graphbin2_output.binning)")
+ap.add_argument("--sample_id", required=False, type=str, default="Sample", help="sample id of the biobox output. [default: Sample]")
+ap.add_argument("--biobox_strip", required=False, default=False, action="store_true", help="strip SPAdes-like contig names (NODE_1234_length_567_cov_8.991) to NODE_1234 in the biobox output")
+ap.add_argument("--biobox_unique", required=False, default=False, action="store_true", help="write multi-binned contigs in their first bin only in the biobox output")
 
 args = vars(ap.parse_args())
 
@@ -44,9 +69,23 @@ contig_bins_file = args["binned"]
 output_path = args["output"]
 prefix = args["prefix"]
 depth = args["depth"]
+nearest_k = args["nearest_k"]
 threshold = args["threshold"]
 delimiter = args["delimiter"]
 nthreads = args["nthreads"]
+memprofile = args["memprofile"]
+trace = args["trace"]
+resume = args["resume"]
+checkpointing = args["checkpoint"]
+checkpoint_interval = args["checkpoint_interval"]
+sweep_file = args["sweep"]
+fasta_index_file = args["fasta_index"]
+bin_fasta = args["bin_fasta"]
+output_format = args["output_format"]
+biobox = args["biobox"]
+sample_id = args["sample_id"]
+biobox_strip = args["biobox_strip"]
+biobox_unique = args["biobox_unique"]
 
 n_bins = 0
 
@@ -78,80 +117,93 @@ logger.info("Existing binning output file: "+contig_bins_file)
 logger.info("Final binning output file: "+output_path)
 logger.info("Depth: "+str(depth))
 logger.info("Threshold: "+str(threshold))
+
+if nearest_k > 0:
+    logger.info("Nearest k: "+str(nearest_k))
+
 logger.info("Number of threads: "+str(nthreads))
 
+if output_format != "csv" and not arrow_available():
+    logger.error("Please install pyarrow (pip install pyarrow) to write outputs in the "+output_format+" format")
+    logger.info("Exiting GraphBin2... Bye...!")
+    sys.exit(1)
+
 logger.info("GraphBin2 started")
 
 start_time = time.time()
 
+metrics = StageMetrics()
+
+if memprofile:
+    memprofiler = MemoryProfiler()
+    metrics.listeners.append(memprofiler)
+
+if trace:
+    tracer = Tracer()
+    metrics.listeners.append(tracer)
+
+metrics.start("parsing")
+
+# Start parsing the input files concurrently
+#--------------------------------------------------------
+
+# The contigs are indexed in a worker process, forked before any thread is started, which
+# only sends back their names and lengths. The assembly graph, abundance and binning files
+# are read in threads so that the parsed graph is not copied between processes
+parsers = ProcessPoolExecutor(max_workers=1, mp_context=get_context("fork"))
+readers = ThreadPoolExecutor(max_workers=3)
+
+contigs_load = parsers.submit(fasta_lengths, contigs_file, nthreads, write_index=fasta_index_file)
+graph_load = readers.submit(read_asqg, assembly_graph_file)
+abundance_load = readers.submit(read_abundance, abundance_file)
+binning_load = readers.submit(read_binning, contig_bins_file, delimiter)
+
 # Get length and coverage of contigs
 #--------------------------------------------------------
 
 contig_lengths = {}
 
-for index, record in enumerate(SeqIO.parse(contigs_file, "fasta")):
+record_ids, record_lengths = contigs_load.result()
+
+for record_id, length in zip(record_ids, record_lengths.tolist()):
     
     start_n = 'contig-'
     end_n = ''
 
-    contig_num = int(re.search('%s(.*)%s' % (start_n, end_n), record.id).group(1))
+    contig_num = int(re.search('%s(.*)%s' % (start_n, end_n), record_id).group(1))
 
-    length = len(record.seq)
     contig_lengths[contig_num] = length
 
 coverages = {}
 
-with open(abundance_file, "r") as my_file:
-    line = my_file.readline()
-    
-    while line!="":
-        strings = line.split("\t")
+for contig_name, coverage in abundance_load.result():
 
-        start_n = 'contig-'
-        end_n = ''
+    start_n = 'contig-'
+    end_n = ''
 
-        contig_num = int(re.search('%s(.*)%s' % (start_n, end_n), strings[0]).group(1))
+    contig_num = int(re.search('%s(.*)%s' % (start_n, end_n), contig_name).group(1))
 
-        coverages[contig_num] = int(strings[1])
-        line = my_file.readline()
+    coverages[contig_num] = coverage
 
 
 
 # Get the links from the .asqg file
 #-----------------------------------
 
-links = []
-
-contig_names = {}
+contig_names = NameTable()
 
-my_map = BidirectionalMap()
+my_map = DenseBidirectionalMap()
 
 node_count = 0
 
 try:
-    # Get contig connections from .asqg file
-    with open(assembly_graph_file) as file:
-        line = file.readline()
-        
-        while line != "":
-
-            # Count the number of contigs
-            if "VT" in line:
-                start = 'contig-'
-                end = ''
-                contig_num = int(re.search('%s(.*)%s' % (start, end), str(line.split()[1])).group(1))
-                my_map[node_count] = contig_num
-                contig_names[node_count] = line.split()[1].strip()
-                node_count += 1
-            
-            # Identify lines with link information
-            elif "ED" in line:
-                link = []
-                strings = line.split("\t")[1].split()
-                link.append(int(strings[0][7:]))
-                link.append(int(strings[1][7:]))
-                links.append(link)
-            line = file.readline()
+    # Get contigs and contig connections from .asqg file
+    vertex_names, vertex_nums, links = graph_load.result()
+
+    for contig_name, contig_num in zip(vertex_names, vertex_nums):
+        my_map[node_count] = contig_num
+        contig_names.append(contig_name)
+        node_count += 1
 
 except:
     logger.error("Please make sure that the correct path to the assembly graph file is provided.")
@@ -161,12 +213,18 @@ except:
 contigs_map = my_map
 contigs_map_rev = my_map.inverse
 
+# Store lengths and coverages of contigs by node id
+contig_lengths = np.array([contig_lengths[contigs_map[i]] for i in range(node_count)], dtype=np.int32)
+coverages = np.array([coverages[contigs_map[i]] for i in range(node_count)], dtype=np.int32)
+
 logger.info("Total number of contigs available: "+str(node_count))
 
 
 ## Construct the assembly graph
 #-------------------------------
 
+metrics.start("graph_build")
+
 try:
 
     # Create the graph
@@ -183,12 +241,9 @@ try:
         assembly_graph.vs[i]["id"]= i
         assembly_graph.vs[i]["label"]= str(i)
 
-    # Iterate links
-    for link in links:
-        # Remove self loops
-        if link[0] != link[1]:
-            # Add edge to list of edges
-            edge_list.append((contigs_map_rev[link[0]], contigs_map_rev[link[1]]))
+    # Translate contig numbers of all links to node ids and remove self loops
+    link_nodes = contigs_map_rev.translate(links)
+    edge_list = [tuple(link) for link in link_nodes[link_nodes[:, 0] != link_nodes[:, 1]].tolist()]
 
     # Add edges to the graph
     assembly_graph.add_edges(edge_list)
@@ -201,23 +256,24 @@ except:
 
 logger.info("Total number of edges in the assembly graph: "+str(len(edge_list)))
 
+if memprofile:
+    memprofiler.record_sizes(links=links, contig_names=contig_names, contigs_map=contigs_map, contig_lengths=contig_lengths, coverages=coverages, edge_list=edge_list, assembly_graph=assembly_graph)
+
 
 # Get the number of bins from the initial binning result
 #--------------------------------------------------------
 
-try:
-    all_bins_list = []
+metrics.start("initial_binning")
 
-    with open(contig_bins_file) as csvfile:
-        readCSV = csv.reader(csvfile, delimiter=delimiter)
-        for row in readCSV:
-            all_bins_list.append(row[1])
-            
-    bins_list = list(set(all_bins_list))
-    bins_list.sort()
+try:
+    binning_names, binning_bins, bin_labels = binning_load.result()
 
-    n_bins = len(bins_list)
+    n_bins = len(bin_labels)
     logger.info("Number of bins available in binning result: "+str(n_bins))
+except ImportError:
+    logger.error("Please install pyarrow (pip install pyarrow) to read a binning result in the Arrow IPC or Parquet format")
+    logger.info("Exiting GraphBin2... Bye...!")
+    sys.exit(1)
 except:
     logger.error("Please make sure that the correct path to the binning result file is provided and it is having the correct format")
     logger.info("Exiting GraphBin2... Bye...!")
@@ -230,15 +286,16 @@ except:
 bins = [[] for x in range(n_bins)]
 
 try:
-    with open(contig_bins_file) as contig_bins:
-        readCSV = csv.reader(contig_bins, delimiter=delimiter)
-        for row in readCSV:
+    for contig_name, bin_num in zip(binning_names, binning_bins.tolist()):
+        contig_num = contig_names.get(contig_name)
+
+        # Names which differ from the contig names (e.g. with a prefix) are matched by their contig number
+        if contig_num is None:
             start = 'contig-'
             end = ''
-            contig_num = contigs_map_rev[int(re.search('%s(.*)%s' % (start, end), row[0]).group(1))]
-            
-            bin_num = int(row[1])-1
-            bins[bin_num].append(contig_num)
+            contig_num = contigs_map_rev[int(re.search('%s(.*)%s' % (start, end), contig_name).group(1))]
+
+        bins[bin_num].append(contig_num)
 
     for i in range(n_bins):
         bins[i].sort()
@@ -248,6 +305,74 @@ except:
     logger.info("Exiting GraphBin2... Bye...!")
     sys.exit(1)
 
+parsers.shutdown()
+readers.shutdown()
+
+
+# Run parameter sweep on the parsed graph
+#-----------------------------------------------------
+
+if sweep_file != "":
+
+    try:
+        sweep_configs = read_sweep_grid(sweep_file, ["depth", "threshold", "nearest_k"])
+    except:
+        logger.error("Please make sure that the correct path to the sweep file is provided and it is having the correct format")
+        logger.info("Exiting GraphBin2... Bye...!")
+        sys.exit(1)
+
+    for config in sweep_configs:
+        if config.get("depth", depth) < 1 or config.get("threshold", threshold) < 1.0:
+            logger.error("Please enter valid numbers for depth and threshold in the sweep file")
+            logger.info("Exiting GraphBin2... Bye...!")
+            sys.exit(1)
+
+        if config.get("nearest_k", nearest_k) < 0:
+            logger.error("Please enter a valid number for nearest_k in the sweep file")
+            logger.info("Exiting GraphBin2... Bye...!")
+            sys.exit(1)
+
+    sweep_prefixes = [prefix+"sweep"+str(i+1)+"_" for i in range(len(sweep_configs))]
+
+    logger.info("Running "+str(len(sweep_configs))+" parameter sets on "+str(nthreads)+" threads")
+
+    sweep_index, sweep_results = fork_sweep(len(sweep_configs), nthreads)
+
+    if sweep_index is None:
+
+        summary_file = output_path + prefix + "sweep_summary.tsv"
+        write_sweep_summary(sweep_configs, sweep_results, sweep_prefixes, summary_file)
+
+        n_failed = len([x for x in sweep_results if x[0] != 0])
+
+        if n_failed > 0:
+            logger.error(str(n_failed)+" parameter sets failed. Please check their log files")
+
+        logger.info("Sweep summary can be found at "+summary_file)
+        logger.info("Thank you for using GraphBin2!")
+        sys.exit(1 if n_failed > 0 else 0)
+
+    # Continue the pipeline in this child with its own parameter set
+    sweep_config = sweep_configs[sweep_index]
+    depth = sweep_config.get("depth", depth)
+    threshold = sweep_config.get("threshold", threshold)
+    nearest_k = sweep_config.get("nearest_k", nearest_k)
+    prefix = sweep_prefixes[sweep_index]
+    nthreads = 1
+
+    logger.removeHandler(fileHandler)
+    fileHandler.close()
+    fileHandler = logging.FileHandler(output_path+"/"+prefix+"graphbin2.log")
+    fileHandler.setLevel(logging.DEBUG)
+    fileHandler.setFormatter(formatter)
+    logger.addHandler(fileHandler)
+
+    logger.info("Parameter set "+str(sweep_index+1)+": "+str(sweep_config))
+
+
+if memprofile:
+    memprofiler.record_sizes(bins=bins)
+
 
 # Get binned and unbinned contigs
 #-----------------------------------------------------
@@ -283,21 +408,62 @@ for i in range(node_count):
         isolated.append(i)
 
 
+# Resume from the last checkpoint
+#-----------------------------------------------------
+
+checkpoint = Checkpoint(output_path + prefix + "graphbin2_checkpoint.pkl", checkpoint_interval, checkpointing or resume,
+                        inputs=[contigs_file, assembly_graph_file, contig_bins_file, abundance_file], assembler="SGA", contigs=node_count, bins=n_bins, depth=depth, threshold=threshold, nearest_k=nearest_k)
+
+resume_state = {}
+
+if resume:
+
+    try:
+        resume_state = checkpoint.load()
+    except CheckpointError as e:
+        logger.error(str(e))
+        logger.info("Exiting GraphBin2... Bye...!")
+        sys.exit(1)
+
+    if checkpoint.stage is None:
+        logger.info("No checkpoint found in the output folder. Starting from the beginning")
+    else:
+        logger.info("Resuming from the checkpoint "+("after" if checkpoint.done else "within")+" stage "+checkpoint.stage)
+        bins = resume_state["bins"]
+        binned_contigs = resume_state["binned_contigs"]
+        unbinned_contigs = resume_state["unbinned_contigs"]
+
+
 # The BFS function to search labelled nodes
 #-----------------------------------------------------
 
+# Totals of the BFS calls, added to the metrics of a stage when it stops
+bfs_totals = {"bfs_calls": 0, "nodes_visited": 0, "bfs_early_exits": 0}
+metrics.add_totals(bfs_totals)
+
 def runBFS(node, threhold=depth):
     queue = []
     visited = set()
-    queue.append(node)
+    queue.append((node, 0))
     depth = {}
     
     depth[node] = 0
     
     labelled_nodes = set()
-    
+
+    # Depth level at which nearest_k labelled contigs were found
+    k_level = None
+
     while (len(queue) > 0):
-        active_node = queue.pop(0)
+        # The level of an entry is the depth it was queued at, which depth[] may have been
+        # raised from since if a node at the same level found it again
+        active_node, level = queue.pop(0)
+
+        # Stop after the level with the nearest k labelled contigs is finished
+        if k_level is not None and level > k_level:
+            bfs_totals["bfs_early_exits"] += 1
+            break
+
         visited.add(active_node)
         
         if active_node in binned_contigs and len(visited) > 1:
@@ -310,7 +476,10 @@ def runBFS(node, threhold=depth):
                     contig_bin = n
                     break
             
-            labelled_nodes.add((node, active_node, contig_bin, depth[active_node], abs(coverages[contigs_map[node]]-coverages[contigs_map[active_node]])))
+            labelled_nodes.add((node, active_node, contig_bin, depth[active_node], abs(coverages[node]-coverages[active_node])))
+
+            if nearest_k > 0 and k_level is None and len(labelled_nodes) >= nearest_k:
+                k_level = level
             
         else:
             for neighbour in assembly_graph.neighbors(active_node, mode=ALL):
@@ -318,8 +487,11 @@ def runBFS(node, threhold=depth):
                     depth[neighbour] = depth[active_node] + 1
                     if depth[neighbour] > threhold:
                         continue
-                    queue.append(neighbour)
+                    queue.append((neighbour, level + 1))
                     
+    bfs_totals["bfs_calls"] += 1
+    bfs_totals["nodes_visited"] += len(visited)
+
     return labelled_nodes
 
 
@@ -329,18 +501,28 @@ def runBFS(node, threhold=depth):
 
 logger.info("Removing labels of unsupported vertices")
 
+metrics.start("removal")
+
+# Labelled contigs found by the BFS of each contig, to check again only the contigs affected by removed labels
+recheck = RecheckIndex()
+
+to_check = binned_contigs
+
 iter_num = 1
 
-while True:
+if checkpoint.resumes("removal"):
+    iter_num = resume_state["iteration"] + 1
+
+while not checkpoint.skip("removal"):
     
     logger.debug("Iteration: "+str(iter_num))
     
     remove_labels = {}
 
     # Initialise progress bar
-    pbar = tqdm(total=len(binned_contigs))
+    pbar = tqdm(total=len(to_check))
 
-    for my_node in binned_contigs:
+    for my_node in to_check:
 
         if my_node not in isolated:
 
@@ -353,6 +535,7 @@ while True:
                     break    
 
             BFS_labelled_nodes = list(runBFS(my_node))
+            recheck.update(my_node, [x[1] for x in BFS_labelled_nodes])
             
             if len(BFS_labelled_nodes)>0:
 
@@ -380,7 +563,7 @@ while True:
                 elif zero_bin_count == (len(BFS_labelled_bin_counts)-1):
 
                     # If contig is not in the bin with maximum number of BFS_labelled_contigs 
-                    if max_index!=my_contig_bin and BFS_labelled_bin_counts[max_index] > 1 and contig_lengths[contigs_map[my_node]]<10000:
+                    if max_index!=my_contig_bin and BFS_labelled_bin_counts[max_index] > 1 and contig_lengths[my_node]<10000:
                         remove_labels[my_node] = my_contig_bin
             
          # Update progress bar
@@ -390,6 +573,10 @@ while True:
     pbar.close()
 
 
+    metrics.iteration(labels_changed=len(remove_labels), contigs_checked=len(to_check))
+    metrics.count("contigs_checked", len(to_check))
+    metrics.count("labels_changed", len(remove_labels))
+
     if len(remove_labels)==0:
         break
     else:
@@ -398,9 +585,19 @@ while True:
             bins[remove_labels[contig]].remove(contig)
             binned_contigs.remove(contig)
             unbinned_contigs.append(contig)
-    
+
+        # Check again only the contigs whose BFS found a removed label
+        affected = recheck.affected(remove_labels)
+
+        to_check = [node for node in binned_contigs if node in affected]
+
+    if checkpoint.due():
+        checkpoint.save("removal", iteration=iter_num, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
     iter_num += 1
 
+checkpoint.save("removal", done=True, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 
 
 # Refine labels of inconsistent vertices
@@ -408,11 +605,17 @@ while True:
 
 logger.info("Refining labels of inconsistent vertices")
 
+metrics.start("refinement")
+
 iter_num = 1
 
 once_moved = []
 
-while True:
+if checkpoint.resumes("refinement"):
+    iter_num = resume_state["iteration"] + 1
+    once_moved = resume_state["once_moved"]
+
+while not checkpoint.skip("refinement"):
     
     logger.debug("Iteration: "+str(iter_num))
     
@@ -481,6 +684,9 @@ while True:
     pbar.close()
 
 
+    metrics.iteration(labels_changed=len(contigs_to_correct))
+    metrics.count("labels_changed", len(contigs_to_correct))
+
     if len(contigs_to_correct)==0:
         break
     else:
@@ -490,61 +696,73 @@ while True:
             bins[old_bin].remove(contig)
             bins[new_bin].append(contig)
             bins[new_bin].sort()
-    
+
+    if checkpoint.due():
+        checkpoint.save("refinement", iteration=iter_num, once_moved=once_moved, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
     iter_num += 1
 
+checkpoint.save("refinement", done=True, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 # Get non isolated contigs
 
 logger.info("Obtaining non isolated contigs")
 
-# Initialise progress bar
-pbar = tqdm(total=node_count)
+metrics.start("component_detection")
 
-non_isolated = []
+if checkpoint.skip("component_detection"):
+    non_isolated = resume_state["non_isolated"]
+else:
+    # Initialise progress bar
+    pbar = tqdm(total=node_count)
 
-for i in range(node_count):
+    non_isolated = []
+
+    for i in range(node_count):
     
-    if i not in non_isolated and i in binned_contigs:
+        if i not in non_isolated and i in binned_contigs:
 
-        component = []
-        component.append(i)
-        length = len(component)
-        neighbours = assembly_graph.neighbors(i, mode=ALL)
+            component = []
+            component.append(i)
+            length = len(component)
+            neighbours = assembly_graph.neighbors(i, mode=ALL)
 
-        for neighbor in neighbours:
-            if neighbor not in component:
-                component.append(neighbor)
+            for neighbor in neighbours:
+                if neighbor not in component:
+                    component.append(neighbor)
 
-        component = list(set(component))
+            component = list(set(component))
 
-        while length!= len(component):
+            while length!= len(component):
 
-            length = len(component)
+                length = len(component)
 
-            for j in component:
+                for j in component:
 
-                neighbours = assembly_graph.neighbors(j, mode=ALL)
+                    neighbours = assembly_graph.neighbors(j, mode=ALL)
 
-                for neighbor in neighbours:
-                    if neighbor not in component:
-                        component.append(neighbor)
+                    for neighbor in neighbours:
+                        if neighbor not in component:
+                            component.append(neighbor)
 
-        labelled = False
-        for j in component:
-            if j in binned_contigs:
-                labelled = True
-                break
-
-        if labelled:
+            labelled = False
             for j in component:
-                if j not in non_isolated:
-                    non_isolated.append(j)
+                if j in binned_contigs:
+                    labelled = True
+                    break
+
+            if labelled:
+                for j in component:
+                    if j not in non_isolated:
+                        non_isolated.append(j)
     
-    # Update progress bar
-    pbar.update(1)
+        # Update progress bar
+        pbar.update(1)
     
-# Close progress bar
-pbar.close()
+    # Close progress bar
+    pbar.close()
+
+checkpoint.save("component_detection", done=True, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
 
 logger.info("Number of non-isolated contigs: "+str(len(non_isolated)))
 
@@ -558,6 +776,8 @@ logger.info("Number of non-isolated unbinned contigs: "+str(len(non_isolated_unb
 
 logger.info("Propagating labels to unlabelled vertices")
 
+metrics.start("propagation")
+
 # Initialise progress bar
 pbar = tqdm(total=len(non_isolated_unbinned))
 
@@ -568,31 +788,43 @@ class DataWrap:
     def __lt__(self, other):
         return (self.data[3], self.data[-1])  < (other.data[3], other.data[-1]) 
     
-contigs_to_bin = set()
+if checkpoint.skip("propagation"):
+    sorted_node_list = []
+elif checkpoint.resumes("propagation"):
+    sorted_node_list = [DataWrap(data) for data in resume_state["heap"]]
+else:
+    contigs_to_bin = set()
 
-for contig in binned_contigs:
-    if contig in non_isolated:
-        closest_neighbours = filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(contig, mode=ALL))
-        contigs_to_bin.update(closest_neighbours)
+    for contig in binned_contigs:
+        if contig in non_isolated:
+            closest_neighbours = filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(contig, mode=ALL))
+            contigs_to_bin.update(closest_neighbours)
 
 
-sorted_node_list = []
-sorted_node_list_ = [list(runBFS(x, threhold=depth)) for x in contigs_to_bin]
-sorted_node_list_ = [item for sublist in sorted_node_list_ for item in sublist]
+    sorted_node_list = []
+    sorted_node_list_ = [list(runBFS(x, threhold=depth)) for x in contigs_to_bin]
+    sorted_node_list_ = [item for sublist in sorted_node_list_ for item in sublist]
 
-for data in sorted_node_list_:
-    heapObj = DataWrap(data)
-    heapq.heappush(sorted_node_list, heapObj)
+    for data in sorted_node_list_:
+        heapObj = DataWrap(data)
+        heapq.heappush(sorted_node_list, heapObj)
+
+    metrics.count("heap_pushes", len(sorted_node_list_))
+
+if memprofile:
+    memprofiler.record_sizes(candidate_heap=sorted_node_list)
 
 
 while sorted_node_list:
     best_choice = heapq.heappop(sorted_node_list)    
     to_bin, binned, bin_, dist, cov_diff = best_choice.data
+    metrics.count("heap_pops")
     
     
     if to_bin in non_isolated_unbinned:
         bins[bin_].append(to_bin)
         binned_contigs.append(to_bin)
+        metrics.count("labels_changed")
         non_isolated_unbinned.remove(to_bin)
         unbinned_contigs.remove(to_bin)
 
@@ -601,31 +833,48 @@ while sorted_node_list:
         
         # Discover to_bin's neighbours
         unbinned_neighbours = set(filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(to_bin, mode=ALL)))
+        heap_size = len(sorted_node_list)
         sorted_node_list = list(filter(lambda x: x.data[0] not in unbinned_neighbours, sorted_node_list))
         heapq.heapify(sorted_node_list)
+        metrics.count("heap_removed", heap_size - len(sorted_node_list))
     
         for n in unbinned_neighbours:
             candidates = list(runBFS(n, threhold=depth))
             for c in candidates:
                 heapq.heappush(sorted_node_list, DataWrap(c))
+            metrics.count("heap_pushes", len(candidates))
+
+        if trace:
+            tracer.counter("propagation", heap=len(sorted_node_list), unbinned=len(non_isolated_unbinned))
+
+    else:
+        metrics.count("heap_stale")
+
+    if checkpoint.due():
+        checkpoint.save("propagation", heap=[x.data for x in sorted_node_list], non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
 
 # Close progress bar
 pbar.close()
 
+checkpoint.save("propagation", done=True, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 
 # Determine contigs belonging to multiple bins
 #-----------------------------------------------------
 
 logger.info("Determining multi-binned contigs")
 
+metrics.start("multi_bin")
+
 bin_cov_sum = [0 for x in range(n_bins)]
 bin_contig_len_total = [0 for x in range(n_bins)]
 
+cov_len = coverages.astype(np.int64) * contig_lengths
+
 for i in range(n_bins):
-    for j in range(len(bins[i])):
-        if bins[i][j] in non_isolated:
-            bin_cov_sum[i] += coverages[contigs_map[bins[i][j]]]*contig_lengths[contigs_map[bins[i][j]]]
-            bin_contig_len_total[i] += contig_lengths[contigs_map[bins[i][j]]]
+    bin_nodes = [x for x in bins[i] if x in non_isolated]
+    bin_cov_sum[i] = int(cov_len[bin_nodes].sum())
+    bin_contig_len_total[i] = int(contig_lengths[bin_nodes].sum())
 
 def is_multi(contig):
     if contig in non_isolated and contig in binned_contigs:
@@ -642,8 +891,8 @@ def is_multi(contig):
         bin_coverages = list(bin_cov_sum)
         bin_contig_lengths = list(bin_contig_len_total)
 
-        bin_coverages[contig_bin] = bin_coverages[contig_bin] - (coverages[contigs_map[contig]]*contig_lengths[contigs_map[contig]])
-        bin_contig_lengths[contig_bin] = bin_contig_lengths[contig_bin] - contig_lengths[contigs_map[contig]]
+        bin_coverages[contig_bin] = bin_coverages[contig_bin] - int(cov_len[contig])
+        bin_contig_lengths[contig_bin] = bin_contig_lengths[contig_bin] - int(contig_lengths[contig])
 
         for i in range(n_bins):
             if bin_contig_lengths[i] != 0:
@@ -661,7 +910,7 @@ def is_multi(contig):
             for n in range(n_bins):
                 if neighbour in bins[n]:
                     neighbour_bins[n].append(neighbour)
-                    neighbour_bin_coverages[n].append(coverages[contigs_map[neighbour]])
+                    neighbour_bin_coverages[n].append(coverages[neighbour])
                     break
 
         zero_bin_count = 0
@@ -692,23 +941,48 @@ def is_multi(contig):
                 for i in range(len(combination)):
                     comb_cov_total += bin_coverages[combination[i]]
 
-                cov_diff = abs(comb_cov_total-coverages[contigs_map[contig]])
+                cov_diff = abs(comb_cov_total-coverages[contig])
 
                 if cov_diff < min_diff:
                     min_diff = cov_diff
                     min_diff_combination = combination
 
-            if min_diff_combination!=-1 and len(min_diff_combination) > 1 and contig_lengths[contigs_map[contig]]>1000:
+            if min_diff_combination!=-1 and len(min_diff_combination) > 1 and contig_lengths[contig]>1000:
                 # return True
                 return contig, min_diff_combination
 
     return None
 
 # Threads and multi-processing
+multi_bins = []
+n_checked = 0
+
+if checkpoint.resumes("multi_bin"):
+    multi_bins = resume_state["multi_bins"]
+    n_checked = resume_state["n_checked"]
+
+traced = []
+
 with Pool(nthreads) as p:
-    mapped = list(tqdm(p.imap(is_multi, list(range(node_count))), total=node_count))
+    for result in tqdm(p.imap(tracer.task(is_multi) if trace else is_multi, list(range(n_checked, node_count))), total=node_count, initial=n_checked):
+
+        if trace:
+            traced.append(result)
+            result = result[0]
 
-multi_bins = list(filter(lambda x: x is not None, mapped))
+        if result is not None:
+            multi_bins.append(result)
+
+        n_checked += 1
+
+        if checkpoint.due():
+            checkpoint.save("multi_bin", n_checked=n_checked, multi_bins=multi_bins, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
+if trace:
+    tracer.worker_results("is_multi", traced)
+
+metrics.count("multi_binned_contigs", len(multi_bins))
+metrics.count("labels_changed", sum(len(x[1])-1 for x in multi_bins))
 
 if len(multi_bins) == 0:
     logger.info("No multi-labelled contigs were found")
@@ -717,7 +991,7 @@ else:
 
 # Add contigs to multiplt bins
 for contig, min_diff_combination in multi_bins:
-    logger.info(contig_names[contig]+" belongs to bins "+', '.join(str(s+1) for s in min_diff_combination))
+    logger.info(contig_names[contig]+" belongs to bins "+', '.join(bin_labels[s] for s in min_diff_combination))
     for mybin in min_diff_combination:
         if contig not in bins[mybin]:
             bins[mybin].append(contig)
@@ -737,25 +1011,59 @@ for i in range(n_bins):
 # Write result to output file
 #-----------------------------------
 
-output_bins = []
+metrics.start("output")
 
-for i in range(node_count):
-    for k in range(n_bins):
-        if i in bins[k]:
-            line = []
-            line.append(contig_names[i])
-            line.append(k+1)
-            output_bins.append(line)
+# Rows of contigs in the order of node ids, with multi-binned contigs in each of their bins
+output_rows = sorted((i, k) for k in range(n_bins) for i in set(bins[k]))
 
-output_file = output_path + prefix + 'graphbin2_output.csv'
+output_file = output_path + prefix + 'graphbin2_output' + OUTPUT_FORMATS[output_format]
+biobox_output = Biobox(output_path + prefix + 'graphbin2_output.binning', sample_id, biobox_strip, biobox_unique) if biobox else None
 
-with open(output_file, mode='w') as output_file:
-    output_writer = csv.writer(output_file, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
-    
-    for row in output_bins:
-        output_writer.writerow(row)
+if trace:
+    tracer.begin("write", file=output_file)
+
+write_binning(output_file, [i for i, _ in output_rows], [k for _, k in output_rows], contig_names, bin_labels, output_format, delimiter, biobox_output)
+
+if trace:
+    tracer.end()
+
+logger.info("Final binning results can be found at "+output_file)
+
+if biobox:
+    logger.info("Final binning results in the biobox format can be found at "+biobox_output.filename)
+
+if bin_fasta:
+    bin_fasta_path = output_path + prefix + "bins/"
+    os.makedirs(bin_fasta_path, exist_ok=True)
+
+    if trace:
+        tracer.begin("write", file=bin_fasta_path)
+
+    try:
+        n_records = write_bin_fasta(contigs_file, bins, contig_names, bin_fasta_filenames(bin_fasta_path, bin_labels), nthreads, write_index=fasta_index_file)
+        metrics.count("bin_fasta_records", n_records)
+        logger.info("FASTA files of the bins can be found at "+bin_fasta_path)
+    except (OSError, KeyError, ValueError) as e:
+        logger.error("Failed to write the FASTA files of the bins: "+(e.args[0] if isinstance(e, KeyError) else str(e)))
+
+    if trace:
+        tracer.end()
+
+checkpoint.remove()
+
+metrics_file = output_path + prefix + "graphbin2_metrics.json"
+metrics.write(metrics_file, assembler="SGA", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins, depth=depth, threshold=threshold, nearest_k=nearest_k, nthreads=nthreads, elapsed_time=time.time()-start_time)
+logger.info("Pipeline metrics can be found at "+metrics_file)
+
+if memprofile:
+    memory_file = output_path + prefix + "graphbin2_memory.json"
+    memprofiler.write(memory_file, assembler="SGA", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins)
+    logger.info("Memory profile can be found at "+memory_file)
 
-logger.info("Final binning results can be found at "+str(output_file.name))
+if trace:
+    trace_file = output_path + prefix + "graphbin2_trace.json"
+    tracer.write(trace_file, assembler="SGA", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins)
+    logger.info("Execution trace can be found at "+trace_file)
 
 
 # Exit program
@@ -1,7 +1,10 @@
 #!/usr/bin/env python3
 
+import sys
+import os
 import csv
 import time
+import numpy as np
 import pandas as pd
 import argparse
 import re
@@ -9,11 +12,22 @@ import heapq
 import itertools as it
 import logging
 
-from multiprocessing import Pool
-from Bio import SeqIO
+from copy import deepcopy
+from multiprocessing import Pool, get_context
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from igraph import *
 from collections import defaultdict
-from bidirectionalmap.bidirectionalmap import BidirectionalMap
+from bidirectionalmap.bidirectionalmap import DenseBidirectionalMap
+from nametable.nametable import NameTable
+from assemblyio.assemblyio import read_gfa, read_contig_paths, spades_contig_paths, open_input, fasta_lengths, read_binning
+from sweep.sweep import read_sweep_grid, fork_sweep, write_sweep_summary
+from metrics.metrics import StageMetrics
+from memprofile.memprofile import MemoryProfiler
+from tracer.tracer import Tracer
+from checkpoint.checkpoint import Checkpoint, CheckpointError
+from recheck.recheck import RecheckIndex
+from binfasta.binfasta import bin_fasta_filenames, write_bin_fasta
+from bintable.bintable import OUTPUT_FORMATS, Biobox, arrow_available, write_binning, write_frame
 from tqdm import tqdm
 
 
@@ -32,6 +46,7 @@ ap.add_argument("--binned", required=True, help="path to the .csv file with the
 ap.add_argument("--output", required=True, help="path to the output folder")
 ap.add_argument("--prefix", required=False, default='', help="prefix for the output file")
 ap.add_argument("--depth", required=False, type=int, default=5, help="maximum depth for the breadth-first-search. [default: 5]")
+ap.add_argument("--nearest_k", required=False, type=int, default=0, help="stop a breadth-first-search after the depth level at which k labelled contigs were found. 0 - search up to the maximum depth. [default: 0]")
 ap.add_argument("--threshold", required=False, type=float, default=1.5, help="threshold for determining inconsistent vertices. [default: 1.5]")
 ap.add_argument("--delimiter", required=False, type=str, default=",", help="delimiter for input/output results [default: , (comma)]")
 ap.add_argument("--nthreads", required=False, type=int, default=8, help="number of threads to use. [default: 8]")
@@ -41,7 +56,19 @@ ap.add_argument("--cov_threshold", required=False, type=int, default=0, help="ne
 ap.add_argument("--len_threshold", required=False, type=int, default=0, help="new threshold for contig length")    #####
 ap.add_argument("--save_interval", required=False, type=int, default=0, help="indicates number of passed iterations needed for current binning save. (5 - save for every 5 iterations). 0 - disable intermediate binning saving") #####
 ap.add_argument("--save_heap", required=False, default=False, action="store_true", help="save heap from every 'save_interval' iteration of label propagation") #####
-ap.add_argument("--gold_standard", required=False, type=str, default="", help="path to the gold standard file for evaluation")
+ap.add_argument("--memprofile", required=False, default=False, action="store_true", help="record peak memory and top allocations of each stage and sizes of the main structures")
+ap.add_argument("--trace", required=False, default=False, action="store_true", help="write a timeline of stages, iterations, worker tasks and file writes in trace-event format")
+ap.add_argument("--resume", required=False, default=False, action="store_true", help="continue from the last checkpoint in the output folder")
+ap.add_argument("--checkpoint", required=False, default=False, action="store_true", help="write checkpoints after each stage to resume the run with --resume")
+ap.add_argument("--checkpoint_interval", required=False, type=int, default=600, help="seconds between checkpoints within long stages. 0 - checkpoint only after each stage")
+ap.add_argument("--sweep", required=False, type=str, default="", help="path to a tab separated file with parameter sets (depth, threshold, cov_threshold, len_threshold, skip_ref) to run on the same parsed graph")
+ap.add_argument("--fasta_index", required=False, default=False, action="store_true", help="write a .fai index of the contigs file next to it, which later runs read instead of scanning the file")
+ap.add_argument("--bin_fasta", required=False, default=False, action="store_true", help="write a FASTA file of the contigs of each bin to the bins folder of the output")
+ap.add_argument("--output_format", required=False, type=str, default="csv", choices=list(OUTPUT_FORMATS), help="format of the binning outputs: csv, arrow (Arrow IPC) or parquet (both need pyarrow). [default: csv]")
+ap.add_argument("--biobox", required=False, default=False, action="store_true", help="also write the final binning in the CAMI biobox format (graphbin2_output.binning)")
+ap.add_argument("--sample_id", required=False, type=str, default="Sample", help="sample id of the biobox output. [default: Sample]")
+ap.add_argument("--biobox_strip", required=False, default=False, action="store_true", help="strip SPAdes-like contig names (NODE_1234_length_567_cov_8.991) to NODE_1234 in the biobox output")
+ap.add_argument("--biobox_unique", required=False, default=False, action="store_true", help="write multi-binned contigs in their first bin only in the biobox output")
 args = vars(ap.parse_args())
 
 contigs_file = args["contigs"]
@@ -51,6 +78,7 @@ contig_bins_file = args["binned"]
 output_path = args["output"]
 prefix = args["prefix"]
 depth = args["depth"]
+nearest_k = args["nearest_k"]
 threshold = args["threshold"]
 delimiter = args["delimiter"]
 nthreads = args["nthreads"]
@@ -62,11 +90,27 @@ len_threshold = args["len_threshold"]
 gold_standard = args["gold_standard"]
 save_interval = args["save_interval"]
 save_heap = args["save_heap"]
+memprofile = args["memprofile"]
+trace = args["trace"]
+resume = args["resume"]
+checkpointing = args["checkpoint"]
+checkpoint_interval = args["checkpoint_interval"]
+sweep_file = args["sweep"]
+fasta_index_file = args["fasta_index"]
+bin_fasta = args["bin_fasta"]
+output_format = args["output_format"]
+biobox = args["biobox"]
+sample_id = args["sample_id"]
+biobox_strip = args["biobox_strip"]
+biobox_unique = args["biobox_unique"]
 
 def write_heap(heap, contigs_map, filename):    #####
     """Write heap into tsv file which contains 5 fields: 'contig to bin', 'binned contig', 'bin of binned contig', 'distance between these two contigs', 'coverage difference'.
     Argument 'contigs_map' is map translating node number into initial contig number"""
 
+    if trace:
+        tracer.begin("write", file=filename)
+
     with open(filename, "w") as output_file:
         output_writer = csv.writer(output_file, delimiter="\t", quotechar='"', quoting=csv.QUOTE_MINIMAL)
         while True:
@@ -76,24 +120,32 @@ def write_heap(heap, contigs_map, filename):    #####
                 out[1] = f"NODE_{contigs_map[out[1]]}"
                 output_writer.writerow(out)
             except IndexError:
-                return
+                break
+
+    if trace:
+        tracer.end()
 
 
 def write_bins(bins, contig_names, filename):
-    output_bins = []
+    """Write a snapshot of the bins to filename (without extension) in the output format."""
+
+    nodes = []
+    bin_numbers = []
 
     for k in range(len(bins)):
         for i in sorted(bins[k]):
-            line = []
-            line.append(contig_names[i])
-            line.append(k+1)
-            output_bins.append(line)
+            nodes.append(i)
+            bin_numbers.append(k)
+
+    filename += OUTPUT_FORMATS[output_format]
+
+    if trace:
+        tracer.begin("write", file=filename)
 
-    with open(filename, mode='w') as output_file:
-        output_writer = csv.writer(output_file, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    write_binning(filename, nodes, bin_numbers, contig_names, bin_labels, output_format, delimiter)
 
-        for row in output_bins:
-            output_writer.writerow(row)
+    if trace:
+        tracer.end()
 
 
 def most_abundant_bins(gold_standard_df, query_df):
@@ -182,85 +234,133 @@ logger.info("Existing binning output file: "+contig_bins_file)
 logger.info("Final binning output file: "+output_path)
 logger.info("Depth: "+str(depth))
 logger.info("Threshold: "+str(threshold))
+
+if nearest_k > 0:
+    logger.info("Nearest k: "+str(nearest_k))
+
 logger.info("Number of threads: "+str(nthreads))
 
+if output_format != "csv" and not arrow_available():
+    logger.error("Please install pyarrow (pip install pyarrow) to write outputs in the "+output_format+" format")
+    logger.info("Exiting GraphBin2... Bye...!")
+    sys.exit(1)
+
 logger.info("GraphBin2 started")
 
 
 
 start_time = time.time()
 
+metrics = StageMetrics()
+
+if memprofile:
+    memprofiler = MemoryProfiler()
+    metrics.listeners.append(memprofiler)
+
+if trace:
+    tracer = Tracer()
+    metrics.listeners.append(tracer)
+
+metrics.start("parsing")
+
+# Start parsing the input files concurrently
+#--------------------------------------------------------
+
+# The contigs are indexed in a worker process, forked before any thread is started, which
+# only sends back their names and lengths. The assembly graph and the binning file are
+# read in threads so that the parsed graph is not copied between processes
+parsers = ProcessPoolExecutor(max_workers=1, mp_context=get_context("fork"))
+readers = ThreadPoolExecutor(max_workers=2)
+
+contigs_load = parsers.submit(fasta_lengths, contigs_file, nthreads, write_index=fasta_index_file)
+graph_load = readers.submit(read_gfa, assembly_graph_file)
+binning_load = readers.submit(read_binning, contig_bins_file, delimiter)
+
 # Get length and coverage of contigs
 #--------------------------------------------------------
 
 contig_lengths = {}
 coverages = {}
 
-my_map = BidirectionalMap()
+my_map = DenseBidirectionalMap()
+
+# The length and coverage of SPAdes contigs are in their ids
+record_ids, _ = contigs_load.result()
 
-for index, record in enumerate(SeqIO.parse(contigs_file, "fasta")):
+for record_id in record_ids:
     start = 'NODE_'
     end = '_length'
-    contig_num = int(re.search('%s(.*)%s' % (start, end), record.id).group(1))
+    contig_num = int(re.search('%s(.*)%s' % (start, end), record_id).group(1))
 
     start = '_length_'
     end = '_cov'
-    length = int(re.search('%s(.*)%s' % (start, end), record.id).group(1))
+    length = int(re.search('%s(.*)%s' % (start, end), record_id).group(1))
 
     start = '_cov_'
     end = ''
-    coverage = int(float(re.search('%s(.*)%s' % (start, end), record.id).group(1)))
+    coverage = int(float(re.search('%s(.*)%s' % (start, end), record_id).group(1)))
 
     contig_lengths[contig_num] = length
     coverages[contig_num] = coverage
 
 
-# Get contig paths from contigs.paths
-#-------------------------------------
+# Get links and contig paths from the .gfa file (or contig paths from contigs.paths)
+#-------------------------------------------------------------------------------------
 
 paths = {}
-segment_contigs = {}
+segment_ids = {}
+path_segments = []
+path_nodes = []
 node_count = 0
 
-contig_names = {}
+contig_names = NameTable()
 
-my_map = BidirectionalMap()
+my_map = DenseBidirectionalMap()
 
 current_contig_num = ""
 
+
+def oriented_segment(segment, orientation):
+    """Id of an oriented segment, 2k for segment k in + orientation and 2k+1 in - orientation."""
+    return 2 * segment_ids.setdefault(segment, len(segment_ids)) + (orientation == "-")
+
+
 try:
-    with open(contig_paths) as file:
-        name = file.readline()
-        path = file.readline()
+    # Get links and the contig paths of P lines in one pass over assembly_graph_with_scaffolds.gfa
+    _, _, links, gfa_paths = graph_load.result()
 
-        while name != "" and path != "":
+except:
+    logger.error("Please make sure that the correct path to the assembly graph file is provided.")
+    logger.info("Exiting GraphBin2... Bye...!")
+    sys.exit(1)
 
-                while ";" in path:
-                    path = path[:-2]+","+file.readline()
+try:
+    # Take the contig paths from contigs.paths if the .gfa file has no P lines
+    if len(gfa_paths) > 0:
+        logger.info("Taking contig paths from the P lines of the assembly graph file")
+        contig_path_records = spades_contig_paths(gfa_paths)
+    else:
+        contig_path_records = read_contig_paths(contig_paths)
 
-                start = 'NODE_'
-                end = '_length_'
-                contig_num = str(int(re.search('%s(.*)%s' % (start, end), name).group(1)))
+    for name, segments in contig_path_records:
 
-                segments = path.rstrip().split(",")
+        start = 'NODE_'
+        end = '_length_'
+        contig_num = str(int(re.search('%s(.*)%s' % (start, end), name).group(1)))
 
-                if current_contig_num != contig_num:
-                    my_map[node_count] = int(contig_num)
-                    contig_names[node_count] = name.strip()
-                    current_contig_num = contig_num
-                    node_count += 1
+        if current_contig_num != contig_num:
+            my_map[node_count] = int(contig_num)
+            contig_names.append(name)
+            current_contig_num = contig_num
+            node_count += 1
 
-                if contig_num not in paths:
-                    paths[contig_num] = [segments[0], segments[-1]]
+        path_ids = [oriented_segment(segment[:-1], segment[-1]) for segment in segments]
 
-                for segment in segments:
-                    if segment not in segment_contigs:
-                        segment_contigs[segment] = set([contig_num])
-                    else:
-                        segment_contigs[segment].add(contig_num)
+        if contig_num not in paths:
+            paths[contig_num] = [path_ids[0], path_ids[-1]]
 
-                name = file.readline()
-                path = file.readline()
+        path_segments.extend(path_ids)
+        path_nodes.extend([node_count-1] * len(path_ids))
 
 except:
     logger.error("Please make sure that the correct path to the contig paths file is provided.")
@@ -270,30 +370,21 @@ except:
 contigs_map = my_map
 contigs_map_rev = my_map.inverse
 
-logger.info("Total number of contigs available: "+str(node_count))
+# Store lengths and coverages of contigs by node id
+contig_lengths = np.array([contig_lengths[contigs_map[i]] for i in range(node_count)], dtype=np.int32)
+coverages = np.array([coverages[contigs_map[i]] for i in range(node_count)], dtype=np.int32)
 
-links = []
-links_map = defaultdict(set)
+logger.info("Total number of contigs available: "+str(node_count))
 
 
 ## Construct the assembly graph
 #-------------------------------
 
-try:
-    # Get links from assembly_graph_with_scaffolds.gfa
-    with open(assembly_graph_file) as file:
-        line = file.readline()
+metrics.start("graph_build")
 
-        while line != "":
-
-            # Identify lines with link information
-            if "L" in line:
-                strings = line.split("\t")
-                f1, f2 = strings[1]+strings[2], strings[3]+strings[4]
-                links_map[f1].add(f2)
-                links_map[f2].add(f1)
-                links.append(strings[1]+strings[2]+" "+strings[3]+strings[4])
-            line = file.readline()
+try:
+    # Get the oriented segments connected by links
+    link_ends = np.array([(oriented_segment(link[0], link[1]), oriented_segment(link[2], link[3])) for link in links], dtype=np.int64).reshape(-1, 2)
 
 
     # Create graph
@@ -302,54 +393,34 @@ try:
     # Add vertices
     assembly_graph.add_vertices(node_count)
 
-    # Create list of edges
-    edge_list = []
-
     # Name vertices
     for i in range(node_count):
         assembly_graph.vs[i]["id"]= i
         assembly_graph.vs[i]["label"]= str(i)
 
-    for i in range(len(paths)):
-        segments = paths[str(contigs_map[i])]
+    # Start and end segments of each contig in both orientations (the reverse of segment id x is x^1)
+    ends = np.array([paths[str(contigs_map[i])] for i in range(node_count)], dtype=np.int64).reshape(-1, 2)
+    contig_ends = pd.DataFrame({"contig": np.repeat(np.arange(node_count), 4),
+                                "segment": np.stack([ends[:, 0], ends[:, 0] ^ 1, ends[:, 1], ends[:, 1] ^ 1], axis=1).ravel()})
 
-        start = segments[0]
-        start_rev = ""
+    # Links in both directions
+    segment_links = pd.DataFrame({"segment": np.concatenate([link_ends[:, 0], link_ends[:, 1]]),
+                                  "linked": np.concatenate([link_ends[:, 1], link_ends[:, 0]])})
 
-        if start.endswith("+"):
-            start_rev = start[:-1]+"-"
-        else:
-            start_rev = start[:-1]+"+"
+    # Contigs whose paths contain each oriented segment
+    segment_contigs = pd.DataFrame({"linked": np.array(path_segments, dtype=np.int64),
+                                    "other": np.array(path_nodes, dtype=np.int64)})
 
-        end = segments[1]
-        end_rev = ""
+    # Join contig ends -> linked segments -> contigs of the linked segments
+    joined = contig_ends.merge(segment_links, on="segment").merge(segment_contigs, on="linked")
+    pairs = joined[["contig", "other"]].to_numpy()
 
-        if end.endswith("+"):
-            end_rev = end[:-1]+"-"
-        else:
-            end_rev = end[:-1]+"+"
-
-        new_links = []
-
-        if start in links_map:
-            new_links.extend(list(links_map[start]))
-        if start_rev in links_map:
-            new_links.extend(list(links_map[start_rev]))
-        if end in links_map:
-            new_links.extend(list(links_map[end]))
-        if end_rev in links_map:
-            new_links.extend(list(links_map[end_rev]))
-
-        for new_link in new_links:
-            if new_link in segment_contigs:
-                for contig in segment_contigs[new_link]:
-                    if i!=int(contig):
-                        # Add edge to list of edges
-                        edge_list.append((i,contigs_map_rev[int(contig)]))
+    # Remove self loops and duplicate edges
+    pairs = np.sort(pairs[pairs[:, 0] != pairs[:, 1]], axis=1)
+    edge_list = np.unique(pairs, axis=0).tolist()
 
     # Add edges to the graph
     assembly_graph.add_edges(edge_list)
-    assembly_graph.simplify(multiple=True, loops=False, combine_edges=None)
 
 except:
     logger.error("Please make sure that the correct path to the assembly graph file is provided.")
@@ -358,43 +429,47 @@ except:
 
 logger.info("Total number of edges in the assembly graph: "+str(len(edge_list)))
 
+if memprofile:
+    memprofiler.record_sizes(links=links, link_ends=link_ends, path_segments=path_segments, paths=paths, contig_names=contig_names, contigs_map=contigs_map, contig_lengths=contig_lengths, coverages=coverages, edge_list=edge_list, assembly_graph=assembly_graph)
+
 
 # Get the number of bins from the initial binning result
 #--------------------------------------------------------
 
-try:
-    all_bins_list = []
-
-    with open(contig_bins_file) as csvfile:
-        readCSV = csv.reader(csvfile, delimiter=delimiter)
-        for row in readCSV:
-            all_bins_list.append(row[1])
+metrics.start("initial_binning")
 
-    bins_list = list(set(all_bins_list))
-    bins_list.sort()
+try:
+    binning_names, binning_bins, bin_labels = binning_load.result()
 
-    n_bins = len(bins_list)
+    n_bins = len(bin_labels)
     logger.info("Number of bins available in binning result: "+str(n_bins))
+except ImportError:
+    logger.error("Please install pyarrow (pip install pyarrow) to read a binning result in the Arrow IPC or Parquet format")
+    logger.info("Exiting GraphBin2... Bye...!")
+    sys.exit(1)
 except:
     logger.error("Please make sure that the correct path to the binning result file is provided and it is having the correct format")
     logger.info("Exiting GraphBin2... Bye...!")
     sys.exit(1)
 
 
+gs_seq_dict = {}
+
 if gold_standard != "":
-    gsdf = pd.read_csv(gold_standard, sep=delimiter, names=['SEQUENCEID', 'BINID', 'LENGTH'])
-    df = pd.read_csv(contig_bins_file, sep=delimiter, names=['SEQUENCEID', 'BINID'])
+    with open_input(gold_standard, "r") as gs_file:
+        gsdf = pd.read_csv(gs_file, sep=delimiter, names=['SEQUENCEID', 'BINID', 'LENGTH'])
+    df = pd.DataFrame({'SEQUENCEID': binning_names, 'BINID': [bin_labels[k] for k in binning_bins.tolist()]})
     abundant_genome_dict = most_abundant_bins(gsdf, df)
     gs_seq_dict_temp = pd.Series((str(x) for x in gsdf['BINID']), index=gsdf['SEQUENCEID']).to_dict()
     # logger.info(gs_seq_dict_temp)
-    gs_seq_dict = {}
     # logger.info(gs_seq_dict_temp)
+    bin_numbers = {label: k for k, label in enumerate(bin_labels)}
     start = 'NODE_'
     end = '_length_'
     for k in gs_seq_dict_temp.keys():
         if gs_seq_dict_temp[k] in abundant_genome_dict.keys():
             contig_num = contigs_map_rev[int(re.search('%s(.*)%s' % (start, end), str(k)).group(1))]
-            gs_seq_dict[contig_num] = int(abundant_genome_dict[gs_seq_dict_temp[k]]) - 1
+            gs_seq_dict[contig_num] = bin_numbers[abundant_genome_dict[gs_seq_dict_temp[k]]]
     # logger.info(len(abundant_genome_dict))
     # logger.info(gs_seq_dict)
     # exit(1)
@@ -413,23 +488,99 @@ if gold_standard != "":
     for cn in gs_seq_dict.keys():
         bins_allowed.add(gs_seq_dict[cn])
 try:
-    with open(contig_bins_file) as contig_bins:
-        readCSV = csv.reader(contig_bins, delimiter=delimiter)
-        for row in readCSV:
-            # row[0] += '_length_'
+    for contig_name, bin_num in zip(binning_names, binning_bins.tolist()):
+        contig_num = contig_names.get(contig_name)
+
+        # Names which differ from the contig names (e.g. rounded coverages) are matched by their contig number
+        if contig_num is None:
             start = 'NODE_'
             end = '_length_'
-            contig_num = contigs_map_rev[int(re.search('%s(.*)%s' % (start, end), row[0]).group(1))]
+            contig_num = contigs_map_rev[int(re.search('%s(.*)%s' % (start, end), contig_name).group(1))]
 
-            bin_num = int(row[1])-1
-            pred_contigs_to_bin[contig_num] = bin_num
-            bins[bin_num].append(contig_num)
+        pred_contigs_to_bin[contig_num] = bin_num
+        bins[bin_num].append(contig_num)
 
 except:
     logger.error("Please make sure that you have provided the correct assembler type and the correct path to the binning result file in the correct format.")
     logger.info("Exiting GraphBin2... Bye...!")
     sys.exit(1)
 
+parsers.shutdown()
+readers.shutdown()
+
+
+# Run parameter sweep on the parsed graph
+#-----------------------------------------------------
+
+if sweep_file != "":
+
+    try:
+        sweep_configs = read_sweep_grid(sweep_file, ["depth", "threshold", "nearest_k", "cov_threshold", "len_threshold", "skip_ref"])
+    except:
+        logger.error("Please make sure that the correct path to the sweep file is provided and it is having the correct format")
+        logger.info("Exiting GraphBin2... Bye...!")
+        sys.exit(1)
+
+    for config in sweep_configs:
+        if config.get("depth", depth) < 1 or config.get("threshold", threshold) < 1.0:
+            logger.error("Please enter valid numbers for depth and threshold in the sweep file")
+            logger.info("Exiting GraphBin2... Bye...!")
+            sys.exit(1)
+
+        if config.get("nearest_k", nearest_k) < 0:
+            logger.error("Please enter a valid number for nearest_k in the sweep file")
+            logger.info("Exiting GraphBin2... Bye...!")
+            sys.exit(1)
+
+        if config.get("cov_threshold", cov_threshold) < 0 or config.get("len_threshold", len_threshold) < 0:
+            logger.error("Please enter valid numbers for cov_threshold and len_threshold in the sweep file")
+            logger.info("Exiting GraphBin2... Bye...!")
+            sys.exit(1)
+
+    sweep_prefixes = [prefix+"sweep"+str(i+1)+"_" for i in range(len(sweep_configs))]
+
+    logger.info("Running "+str(len(sweep_configs))+" parameter sets on "+str(nthreads)+" threads")
+
+    sweep_index, sweep_results = fork_sweep(len(sweep_configs), nthreads)
+
+    if sweep_index is None:
+
+        summary_file = output_path + prefix + "sweep_summary.tsv"
+        write_sweep_summary(sweep_configs, sweep_results, sweep_prefixes, summary_file)
+
+        n_failed = len([x for x in sweep_results if x[0] != 0])
+
+        if n_failed > 0:
+            logger.error(str(n_failed)+" parameter sets failed. Please check their log files")
+
+        logger.info("Sweep summary can be found at "+summary_file)
+        logger.info("Thank you for using GraphBin2!")
+        sys.exit(1 if n_failed > 0 else 0)
+
+    # Continue the pipeline in this child with its own parameter set
+    sweep_config = sweep_configs[sweep_index]
+    depth = sweep_config.get("depth", depth)
+    threshold = sweep_config.get("threshold", threshold)
+    nearest_k = sweep_config.get("nearest_k", nearest_k)
+    cov_threshold = sweep_config.get("cov_threshold", cov_threshold)
+    len_threshold = sweep_config.get("len_threshold", len_threshold)
+    skip_ref = sweep_config.get("skip_ref", skip_ref)
+    prefix = sweep_prefixes[sweep_index]
+    nthreads = 1
+
+    logger.removeHandler(fileHandler)
+    fileHandler.close()
+    fileHandler = logging.FileHandler(output_path+"/"+prefix+"graphbin2.log")
+    fileHandler.setLevel(logging.DEBUG)
+    fileHandler.setFormatter(formatter)
+    logger.addHandler(fileHandler)
+
+    logger.info("Parameter set "+str(sweep_index+1)+": "+str(sweep_config))
+
+
+if memprofile:
+    memprofiler.record_sizes(bins=bins)
+
 
 # Get binned and unbinned contigs
 #-----------------------------------------------------
@@ -467,21 +618,62 @@ for i in range(node_count):
 logger.info("Number of isolated contigs: "+str(len(isolated)))
 
 
+# Resume from the last checkpoint
+#-----------------------------------------------------
+
+checkpoint = Checkpoint(output_path + prefix + "graphbin2_checkpoint.pkl", checkpoint_interval, checkpointing or resume,
+                        inputs=[contigs_file, assembly_graph_file, contig_paths, contig_bins_file], assembler="SPAdes", contigs=node_count, bins=n_bins, depth=depth, threshold=threshold, nearest_k=nearest_k, cov_threshold=cov_threshold, len_threshold=len_threshold, skip_ref=skip_ref, add_true_depth=add_true_depth)
+
+resume_state = {}
+
+if resume:
+
+    try:
+        resume_state = checkpoint.load()
+    except CheckpointError as e:
+        logger.error(str(e))
+        logger.info("Exiting GraphBin2... Bye...!")
+        sys.exit(1)
+
+    if checkpoint.stage is None:
+        logger.info("No checkpoint found in the output folder. Starting from the beginning")
+    else:
+        logger.info("Resuming from the checkpoint "+("after" if checkpoint.done else "within")+" stage "+checkpoint.stage)
+        bins = resume_state["bins"]
+        binned_contigs = resume_state["binned_contigs"]
+        unbinned_contigs = resume_state["unbinned_contigs"]
+
+
 # The BFS function to search labelled nodes
 #-----------------------------------------------------
 
+# Totals of the BFS calls, added to the metrics of a stage when it stops
+bfs_totals = {"bfs_calls": 0, "nodes_visited": 0, "bfs_early_exits": 0}
+metrics.add_totals(bfs_totals)
+
 def runBFS(node, threhold=depth, add_depth=0):
     queue = []
     visited = set()
-    queue.append(node)
+    queue.append((node, 0))
     depth = {}
 
     depth[node] = 0
 
     labelled_nodes = set()
 
+    # Depth level at which nearest_k labelled contigs were found
+    k_level = None
+
     while (len(queue) > 0):
-        active_node = queue.pop(0)
+        # The level of an entry is the depth it was queued at, which depth[] may have been
+        # raised from since if a node at the same level found it again
+        active_node, level = queue.pop(0)
+
+        # Stop after the level with the nearest k labelled contigs is finished
+        if k_level is not None and level > k_level:
+            bfs_totals["bfs_early_exits"] += 1
+            break
+
         visited.add(active_node)
 
         if active_node in binned_contigs and len(visited) > 1:
@@ -494,7 +686,10 @@ def runBFS(node, threhold=depth, add_depth=0):
                     contig_bin = n
                     break
 
-            labelled_nodes.add((node, active_node, contig_bin, depth[active_node], abs(coverages[contigs_map[node]]-coverages[contigs_map[active_node]])))
+            labelled_nodes.add((node, active_node, contig_bin, depth[active_node], abs(coverages[node]-coverages[active_node])))
+
+            if nearest_k > 0 and k_level is None and len(labelled_nodes) >= nearest_k:
+                k_level = level
 
         else:
             for neighbour in assembly_graph.neighbors(active_node, mode=ALL):
@@ -516,10 +711,13 @@ def runBFS(node, threhold=depth, add_depth=0):
                     depth[neighbour] = depth[active_node] + 1
                     if depth[neighbour] > threhold:
                         continue
-                    queue.append(neighbour)
+                    queue.append((neighbour, level + 1))
             add_depth -=1
 
 
+    bfs_totals["bfs_calls"] += 1
+    bfs_totals["nodes_visited"] += len(visited)
+
     return labelled_nodes
 
 
@@ -528,61 +726,82 @@ if add_true_depth > 0:
         _ = runBFS(contig, threhold=depth, add_depth=add_true_depth)
 
 
-graph_depth_counter = defaultdict(lambda: defaultdict(int))
+# Depth maps of labels before refinement
+metrics.start("depth_maps")
 
-for contig in binned_contigs:
-    contig_info = runBFS(contig, threhold=depth)
-    for node in contig_info:
-        if node[3] <= depth and node[3] != 0:
-            graph_depth_counter[contig][node[3]] += 1
+if gold_standard != "":
+    graph_depth_counter = defaultdict(lambda: defaultdict(int))
 
-depth_map_before_init = defaultdict(lambda: defaultdict(int))
-for contig in binned_contigs:
-    contig_info = runBFS(contig, threhold=depth)
-    for node in contig_info:
-        if contig not in gs_seq_dict.keys():
-            break
-        if node[1] not in gs_seq_dict.keys():
-            continue
-        if node[3] <= depth and node[3] != 0:
-            depth_map_before_init[contig][node[3]] +=1/graph_depth_counter[contig][node[3]] if  \
-                gs_seq_dict[contig] == gs_seq_dict[node[1]] else 0
+    for contig in binned_contigs:
+        contig_info = runBFS(contig, threhold=depth)
+        for node in contig_info:
+            if node[3] <= depth and node[3] != 0:
+                graph_depth_counter[contig][node[3]] += 1
+
+    depth_map_before_init = defaultdict(lambda: defaultdict(int))
+    for contig in binned_contigs:
+        contig_info = runBFS(contig, threhold=depth)
+        for node in contig_info:
+            if contig not in gs_seq_dict.keys():
+                break
+            if node[1] not in gs_seq_dict.keys():
+                continue
+            if node[3] <= depth and node[3] != 0:
+                depth_map_before_init[contig][node[3]] +=1/graph_depth_counter[contig][node[3]] if  \
+                    gs_seq_dict[contig] == gs_seq_dict[node[1]] else 0
 
-list_of_lists = []
+    list_of_lists = []
 
-for k, v in depth_map_before_init.items():
-    _ = [contigs_map[k]]
-    t__ = [0] * depth
-    for k_1, v_1 in v.items():
-        t__[k_1 - 1] = round(v_1,2) if v_1 != 0 else 0
-    _ += t__
-    list_of_lists.append(_)
+    for k, v in depth_map_before_init.items():
+        _ = [contigs_map[k]]
+        t__ = [0] * depth
+        for k_1, v_1 in v.items():
+            t__[k_1 - 1] = round(v_1,2) if v_1 != 0 else 0
+        _ += t__
+        list_of_lists.append(_)
 
-df = pd.DataFrame(list_of_lists, columns=['contig_num'] + ['depth' + str(k+1) for k in range(depth)])
-df.to_csv(output_path + 'depth_map_before_init.csv', index=False, sep='\t')
+    df = pd.DataFrame(list_of_lists, columns=['contig_num'] + ['depth' + str(k+1) for k in range(depth)])
+    depth_map_file = output_path + prefix + 'depth_map_before_init' + OUTPUT_FORMATS[output_format]
+
+    if trace:
+        tracer.begin("write", file=depth_map_file)
+
+    write_frame(df, depth_map_file, output_format, sep='\t')
+
+    if trace:
+        tracer.end()
 
 
 if add_true_depth > 0:
-    write_bins(bins, contig_names, output_path + prefix + "bfs_res.csv")
+    write_bins(bins, contig_names, output_path + prefix + "bfs_res")
 
 # Remove labels of unsupported vertices
 #-----------------------------------------------------
 
 logger.info("Removing labels of unsupported vertices")
 
+metrics.start("removal")
+
+# Labelled contigs found by the BFS of each contig, to check again only the contigs affected by removed labels
+recheck = RecheckIndex()
+
+to_check = binned_contigs
+
 iter_num = 1
 
+if checkpoint.resumes("removal"):
+    iter_num = resume_state["iteration"] + 1
 
-while True:
+while not checkpoint.skip("removal"):
 
     logger.debug("Iteration: "+str(iter_num))
 
     remove_labels = {}
 
     # Initialise progress bar
-    pbar = tqdm(total=len(binned_contigs))
+    pbar = tqdm(total=len(to_check))
 
-    for my_node in binned_contigs:
+    for my_node in to_check:
 
         if my_node not in isolated:
 
@@ -595,6 +814,7 @@ while True:
                     break
 
             BFS_labelled_nodes = list(runBFS(my_node))
+            recheck.update(my_node, [x[1] for x in BFS_labelled_nodes])
 
             if len(BFS_labelled_nodes)>0:
 
@@ -622,7 +842,7 @@ while True:
                 elif zero_bin_count == (len(BFS_labelled_bin_counts)-1):
 
                     # If contig is not in the bin with maximum number of BFS_labelled_contigs
-                    if max_index!=my_contig_bin and BFS_labelled_bin_counts[max_index] > 1 and contig_lengths[contigs_map[my_node]]<10000:
+                    if max_index!=my_contig_bin and BFS_labelled_bin_counts[max_index] > 1 and contig_lengths[my_node]<10000:
                         remove_labels[my_node] = my_contig_bin
 
         # Update progress bar
@@ -632,6 +852,10 @@ while True:
     pbar.close()
 
 
+    metrics.iteration(labels_changed=len(remove_labels), contigs_checked=len(to_check))
+    metrics.count("contigs_checked", len(to_check))
+    metrics.count("labels_changed", len(remove_labels))
+
     if len(remove_labels)==0:
         break
     else:
@@ -641,24 +865,40 @@ while True:
             binned_contigs.remove(contig)
             unbinned_contigs.append(contig)
 
+        # Check again only the contigs whose BFS found a removed label
+        affected = recheck.affected(remove_labels)
+
+        to_check = [node for node in binned_contigs if node in affected]
+
+    if checkpoint.due():
+        checkpoint.save("removal", iteration=iter_num, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
     iter_num += 1
 
+checkpoint.save("removal", done=True, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 if save_interval:   #####
-    write_bins(bins, contigs_map, output_path + prefix + "after_removal.csv" )
+    write_bins(bins, contigs_map, output_path + prefix + "after_removal")
 
 
 # Refine labels of inconsistent vertices
 #-----------------------------------------------------
 if not skip_ref:  #####
-    print("\nRefining labels of inconsistent vertices...")
+    logger.info("Refining labels of inconsistent vertices")
+
+    metrics.start("refinement")
 
     iter_num = 1
 
     once_moved = []
 
-    while True:
+    if checkpoint.resumes("refinement"):
+        iter_num = resume_state["iteration"] + 1
+        once_moved = resume_state["once_moved"]
+
+    while not checkpoint.skip("refinement"):
 
-        print("Iteration:", iter_num)
+        logger.debug("Iteration: "+str(iter_num))
 
         contigs_to_correct = {}
 
@@ -724,6 +964,9 @@ if not skip_ref:  #####
         # Close progress bar
         pbar.close()
 
+        metrics.iteration(labels_changed=len(contigs_to_correct))
+        metrics.count("labels_changed", len(contigs_to_correct))
+
         if len(contigs_to_correct)==0:
             break
         else:
@@ -734,64 +977,76 @@ if not skip_ref:  #####
                 bins[new_bin].append(contig)
                 bins[new_bin].sort()
 
+        if checkpoint.due():
+            checkpoint.save("refinement", iteration=iter_num, once_moved=once_moved, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
         iter_num += 1
 
+checkpoint.save("refinement", done=True, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 if save_interval:   #####
-    write_bins(bins, contigs_map, output_path + prefix + f"propagation_0.csv")
+    write_bins(bins, contigs_map, output_path + prefix + f"propagation_0")
 
 # Get non isolated contigs
 
 logger.info("Obtaining non isolated contigs")
 
-# Initialise progress bar
-pbar = tqdm(total=node_count)
+metrics.start("component_detection")
 
-non_isolated = []
+if checkpoint.skip("component_detection"):
+    non_isolated = resume_state["non_isolated"]
+else:
+    # Initialise progress bar
+    pbar = tqdm(total=node_count)
 
-for i in range(node_count):
+    non_isolated = []
 
-    if i not in non_isolated and i in binned_contigs:
+    for i in range(node_count):
 
-        component = []
-        component.append(i)
-        length = len(component)
-        neighbours = assembly_graph.neighbors(i, mode=ALL)
+        if i not in non_isolated and i in binned_contigs:
 
-        for neighbor in neighbours:
+            component = []
+            component.append(i)
+            length = len(component)
+            neighbours = assembly_graph.neighbors(i, mode=ALL)
 
-            if neighbor not in component:
-                component.append(neighbor)
+            for neighbor in neighbours:
 
-        component = list(set(component))
+                if neighbor not in component:
+                    component.append(neighbor)
 
-        while length!= len(component):
+            component = list(set(component))
 
-            length = len(component)
+            while length!= len(component):
 
-            for j in component:
+                length = len(component)
 
-                neighbours = assembly_graph.neighbors(j, mode=ALL)
+                for j in component:
 
-                for neighbor in neighbours:
-                    if neighbor not in component:
-                        component.append(neighbor)
+                    neighbours = assembly_graph.neighbors(j, mode=ALL)
 
-        labelled = False
-        for j in component:
-            if j in binned_contigs:
-                labelled = True
-                break
+                    for neighbor in neighbours:
+                        if neighbor not in component:
+                            component.append(neighbor)
 
-        if labelled:
+            labelled = False
             for j in component:
-                if j not in non_isolated:
-                    non_isolated.append(j)
+                if j in binned_contigs:
+                    labelled = True
+                    break
 
-    # Update progress bar
-    pbar.update(1)
+            if labelled:
+                for j in component:
+                    if j not in non_isolated:
+                        non_isolated.append(j)
 
-# Close progress bar
-pbar.close()
+        # Update progress bar
+        pbar.update(1)
+
+    # Close progress bar
+    pbar.close()
+
+checkpoint.save("component_detection", done=True, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
 
 
 # Propagating true labels
@@ -807,7 +1062,7 @@ non_isolated_unbinned = list(set(non_isolated).intersection(set(unbinned_contigs
 logger.info("Number of non-isolated unbinned contigs: "+str(len(non_isolated_unbinned)))
 
 
-write_bins(bins, contig_names, output_path + prefix + "stage_2.csv")
+write_bins(bins, contig_names, output_path + prefix + "stage_2")
 
 
 # Propagate labels to unlabelled vertices
@@ -815,6 +1070,8 @@ write_bins(bins, contig_names, output_path + prefix + "stage_2.csv")
 
 logger.info("Propagating labels to unlabelled vertices")
 
+metrics.start("propagation")
+
 # Initialise progress bar
 pbar = tqdm(total=len(non_isolated_unbinned))
 
@@ -825,41 +1082,58 @@ class DataWrap:
     def __lt__(self, other):
         return (self.data[3], self.data[-1])  < (other.data[3], other.data[-1])
 
-contigs_to_bin = set()
+if checkpoint.skip("propagation"):
+    sorted_node_list = []
+elif checkpoint.resumes("propagation"):
+    sorted_node_list = [DataWrap(data) for data in resume_state["heap"]]
+else:
+    contigs_to_bin = set()
+
+    for contig in binned_contigs:
+        if contig in non_isolated:
+            closest_neighbours = filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(contig, mode=ALL))
+            contigs_to_bin.update(closest_neighbours)
+
 
-for contig in binned_contigs:
-    if contig in non_isolated:
-        closest_neighbours = filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(contig, mode=ALL))
-        contigs_to_bin.update(closest_neighbours)
+    sorted_node_list = []
+    sorted_node_list_ = [list(runBFS(x, threhold=depth)) for x in contigs_to_bin]
+    sorted_node_list_ = [item for sublist in sorted_node_list_ for item in sublist]
 
+    for data in sorted_node_list_:
+        heapObj = DataWrap(data)
+        heapq.heappush(sorted_node_list, heapObj)
 
-sorted_node_list = []
-sorted_node_list_ = [list(runBFS(x, threhold=depth)) for x in contigs_to_bin]
-sorted_node_list_ = [item for sublist in sorted_node_list_ for item in sublist]
+    metrics.count("heap_pushes", len(sorted_node_list_))
 
-for data in sorted_node_list_:
-    heapObj = DataWrap(data)
-    heapq.heappush(sorted_node_list, heapObj)
+if memprofile:
+    memprofiler.record_sizes(candidate_heap=sorted_node_list)
 
 prop_iter = 1
+
+if checkpoint.resumes("propagation"):
+    prop_iter = resume_state["prop_iter"]
+
 while sorted_node_list:
     if save_interval != 0 and save_heap and prop_iter % save_interval == 0:    #####
-        write_heap(deepcopy(sorted_node_list), contigs_map, f"heap_{prop_iter}.tsv")
+        write_heap(deepcopy(sorted_node_list), contigs_map, output_path + prefix + f"heap_{prop_iter}.tsv")
 
     # Pop items from heap until contig that satisfies thresholds is picked. If heap becomes empty propagation ends.
     while sorted_node_list:  #####
         best_choice = heapq.heappop(sorted_node_list)
         to_bin, binned, bin_, dist, cov_diff = best_choice.data
-        good_contig = coverages[contigs_map[to_bin]] >= cov_threshold and \
-                      contig_lengths[contigs_map[to_bin]] >= len_threshold
+        metrics.count("heap_pops")
+        good_contig = coverages[to_bin] >= cov_threshold and \
+                      contig_lengths[to_bin] >= len_threshold
         if good_contig:
             break
+        metrics.count("heap_filtered")
     else:
         break
 
     if to_bin in non_isolated_unbinned:
         bins[bin_].append(to_bin)
         binned_contigs.append(to_bin)
+        metrics.count("labels_changed")
         non_isolated_unbinned.remove(to_bin)
         unbinned_contigs.remove(to_bin)
 
@@ -868,33 +1142,101 @@ while sorted_node_list:
 
         # Discover to_bin's neighbours
         unbinned_neighbours = set(filter(lambda x: x not in binned_contigs, assembly_graph.neighbors(to_bin, mode=ALL)))
+        heap_size = len(sorted_node_list)
         sorted_node_list = list(filter(lambda x: x.data[0] not in unbinned_neighbours, sorted_node_list))
         heapq.heapify(sorted_node_list)
+        metrics.count("heap_removed", heap_size - len(sorted_node_list))
 
         for n in unbinned_neighbours:
             candidates = list(runBFS(n, threhold=depth))
             for c in candidates:
                 heapq.heappush(sorted_node_list, DataWrap(c))
+            metrics.count("heap_pushes", len(candidates))
+
+        if trace:
+            tracer.counter("propagation", heap=len(sorted_node_list), unbinned=len(non_isolated_unbinned))
+    else:
+        metrics.count("heap_stale")
+
     if save_interval != 0 and prop_iter % save_interval == 0:    #####
-        write_bins(bins, contigs_map, output_path + prefix + f"propagation_{prop_iter}.csv")
+        write_bins(bins, contigs_map, output_path + prefix + f"propagation_{prop_iter}")
     prop_iter += 1
 
+    if checkpoint.due():
+        checkpoint.save("propagation", prop_iter=prop_iter, heap=[x.data for x in sorted_node_list], non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
 # Close progress bar
 pbar.close()
 
+checkpoint.save("propagation", done=True, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
+
+# Depth maps of labels after propagation
+metrics.start("depth_maps")
+
+contigs_to_propagated = {}
+for i in range(n_bins):
+    for contig in bins[i]:
+        contigs_to_propagated[contig] = i
+
+if gold_standard != "":
+    graph_depth_counter = defaultdict(lambda: defaultdict(int))
+
+    for contig in binned_contigs:
+        contig_info = runBFS(contig, threhold=depth)
+        for node in contig_info:
+            if node[3] <= depth and node[3] != 0:
+                graph_depth_counter[contig][node[3]] += 1
+
+
+    depth_map_after_propag = defaultdict(lambda: defaultdict(int))
+    for contig in binned_contigs:
+        contig_info = runBFS(contig, threhold=depth)
+        for node in contig_info:
+            if contig not in gs_seq_dict.keys():
+                break
+            if node[1] not in contigs_to_propagated.keys():
+                continue
+            if node[3] <= depth and node[3] != 0 and graph_depth_counter[contig][node[3]] != 0:
+                depth_map_after_propag[contig][node[3]] += 1 / graph_depth_counter[contig][node[3]] if \
+                    gs_seq_dict[contig] == contigs_to_propagated[node[1]] else 0
+
+    list_of_lists = []
+
+    for k, v in depth_map_after_propag.items():
+        _ = [contigs_map[k]]
+        t__ = [0] * depth
+        for k_1, v_1 in v.items():
+            t__[k_1 - 1] = round(v_1,2) if v_1 != 0 else 0
+        _ += t__
+        list_of_lists.append(_)
+
+    df = pd.DataFrame(list_of_lists, columns=['contig_num'] + ['depth' + str(k+1) for k in range(depth)])
+    depth_map_file = output_path + prefix + 'depth_map_after_propagation' + OUTPUT_FORMATS[output_format]
+
+    if trace:
+        tracer.begin("write", file=depth_map_file)
+
+    write_frame(df, depth_map_file, output_format, sep='\t')
+
+    if trace:
+        tracer.end()
+
 # Determine contigs belonging to multiple bins
 #-----------------------------------------------------
 
 logger.info("Determining multi-binned contigs")
 
+metrics.start("multi_bin")
+
 bin_cov_sum = [0 for x in range(n_bins)]
 bin_contig_len_total = [0 for x in range(n_bins)]
 
+cov_len = coverages.astype(np.int64) * contig_lengths
+
 for i in range(n_bins):
-    for j in range(len(bins[i])):
-        if bins[i][j] in non_isolated:
-            bin_cov_sum[i] += coverages[contigs_map[bins[i][j]]]*contig_lengths[contigs_map[bins[i][j]]]
-            bin_contig_len_total[i] += contig_lengths[contigs_map[bins[i][j]]]
+    bin_nodes = [x for x in bins[i] if x in non_isolated]
+    bin_cov_sum[i] = int(cov_len[bin_nodes].sum())
+    bin_contig_len_total[i] = int(contig_lengths[bin_nodes].sum())
 
 def is_multi(contig):
     if contig in non_isolated and contig in binned_contigs:
@@ -911,8 +1253,8 @@ def is_multi(contig):
         bin_coverages = list(bin_cov_sum)
         bin_contig_lengths = list(bin_contig_len_total)
 
-        bin_coverages[contig_bin] = bin_coverages[contig_bin] - (coverages[contigs_map[contig]]*contig_lengths[contigs_map[contig]])
-        bin_contig_lengths[contig_bin] = bin_contig_lengths[contig_bin] - contig_lengths[contigs_map[contig]]
+        bin_coverages[contig_bin] = bin_coverages[contig_bin] - int(cov_len[contig])
+        bin_contig_lengths[contig_bin] = bin_contig_lengths[contig_bin] - int(contig_lengths[contig])
 
         for i in range(n_bins):
             if bin_contig_lengths[i] != 0:
@@ -930,7 +1272,7 @@ def is_multi(contig):
             for n in range(n_bins):
                 if neighbour in bins[n]:
                     neighbour_bins[n].append(neighbour)
-                    neighbour_bin_coverages[n].append(coverages[contigs_map[neighbour]])
+                    neighbour_bin_coverages[n].append(coverages[neighbour])
                     break
 
         zero_bin_count = 0
@@ -961,62 +1303,48 @@ def is_multi(contig):
                 for i in range(len(combination)):
                     comb_cov_total += bin_coverages[combination[i]]
 
-                cov_diff = abs(comb_cov_total-coverages[contigs_map[contig]])
+                cov_diff = abs(comb_cov_total-coverages[contig])
 
                 if cov_diff < min_diff:
                     min_diff = cov_diff
                     min_diff_combination = combination
 
-            if min_diff_combination!=-1 and len(min_diff_combination) > 1 and contig_lengths[contigs_map[contig]]>1000:
+            if min_diff_combination!=-1 and len(min_diff_combination) > 1 and contig_lengths[contig]>1000:
                 # return True
                 return contig, min_diff_combination
 
     return None
 
-contigs_to_propagated = {}
-for i in range(n_bins):
-    for contig in bins[i]:
-        contigs_to_propagated[contig] = i
+# Threads and multi-processing
+multi_bins = []
+n_checked = 0
 
-graph_depth_counter = defaultdict(lambda: defaultdict(int))
+if checkpoint.resumes("multi_bin"):
+    multi_bins = resume_state["multi_bins"]
+    n_checked = resume_state["n_checked"]
 
-for contig in binned_contigs:
-    contig_info = runBFS(contig, threhold=depth)
-    for node in contig_info:
-        if node[3] <= depth and node[3] != 0:
-            graph_depth_counter[contig][node[3]] += 1
+traced = []
 
+with Pool(nthreads) as p:
+    for result in tqdm(p.imap(tracer.task(is_multi) if trace else is_multi, list(range(n_checked, node_count))), total=node_count, initial=n_checked):
 
-depth_map_after_propag = defaultdict(lambda: defaultdict(int))
-for contig in binned_contigs:
-    contig_info = runBFS(contig, threhold=depth)
-    for node in contig_info:
-        if contig not in gs_seq_dict.keys():
-            break
-        if node[1] not in contigs_to_propagated.keys():
-            continue
-        if node[3] <= depth and node[3] != 0 and graph_depth_counter[contig][node[3]] != 0:
-            depth_map_after_propag[contig][node[3]] += 1 / graph_depth_counter[contig][node[3]] if \
-                gs_seq_dict[contig] == contigs_to_propagated[node[1]] else 0
+        if trace:
+            traced.append(result)
+            result = result[0]
 
-list_of_lists = []
+        if result is not None:
+            multi_bins.append(result)
 
-for k, v in depth_map_after_propag.items():
-    _ = [contigs_map[k]]
-    t__ = [0] * depth
-    for k_1, v_1 in v.items():
-        t__[k_1 - 1] = round(v_1,2) if v_1 != 0 else 0
-    _ += t__
-    list_of_lists.append(_)
+        n_checked += 1
 
-df = pd.DataFrame(list_of_lists, columns=['contig_num'] + ['depth' + str(k+1) for k in range(depth)])
-df.to_csv(output_path + 'depth_map_after_propagation.csv', index=False, sep='\t')
+        if checkpoint.due():
+            checkpoint.save("multi_bin", n_checked=n_checked, multi_bins=multi_bins, non_isolated=non_isolated, bins=bins, binned_contigs=binned_contigs, unbinned_contigs=unbinned_contigs)
 
-# Threads and multi-processing
-with Pool(nthreads) as p:
-    mapped = list(tqdm(p.imap(is_multi, list(range(node_count))), total=node_count))
+if trace:
+    tracer.worker_results("is_multi", traced)
 
-multi_bins = list(filter(lambda x: x is not None, mapped))
+metrics.count("multi_binned_contigs", len(multi_bins))
+metrics.count("labels_changed", sum(len(x[1])-1 for x in multi_bins))
 
 if len(multi_bins) == 0:
     logger.info("No multi-labelled contigs were found ==>")
@@ -1025,7 +1353,7 @@ else:
 
 # Add contigs to multiplt bins
 for contig, min_diff_combination in multi_bins:
-    logger.info(contig_names[contig]+" belongs to bins "+', '.join(str(s+1) for s in min_diff_combination))
+    logger.info(contig_names[contig]+" belongs to bins "+', '.join(bin_labels[s] for s in min_diff_combination))
     for mybin in min_diff_combination:
         if contig not in bins[mybin]:
             bins[mybin].append(contig)
@@ -1045,27 +1373,61 @@ for i in range(n_bins):
 # Write result to output file
 #-----------------------------------
 
+metrics.start("output")
+
 logger.info("Writing the final binning results to file")
 
-output_bins = []
+# Rows of contigs in the order of node ids, with multi-binned contigs in each of their bins
+output_rows = sorted((i, k) for k in range(n_bins) for i in set(bins[k]))
 
-for i in range(node_count):
-    for k in range(n_bins):
-        if i in bins[k]:
-            line = []
-            line.append(contig_names[i])
-            line.append(k+1)
-            output_bins.append(line)
+output_file = output_path + prefix + 'graphbin2_output' + OUTPUT_FORMATS[output_format]
+biobox_output = Biobox(output_path + prefix + 'graphbin2_output.binning', sample_id, biobox_strip, biobox_unique) if biobox else None
+
+if trace:
+    tracer.begin("write", file=output_file)
+
+write_binning(output_file, [i for i, _ in output_rows], [k for _, k in output_rows], contig_names, bin_labels, output_format, delimiter, biobox_output)
+
+if trace:
+    tracer.end()
+
+logger.info("Final binning results can be found at "+output_file)
+
+if biobox:
+    logger.info("Final binning results in the biobox format can be found at "+biobox_output.filename)
+
+if bin_fasta:
+    bin_fasta_path = output_path + prefix + "bins/"
+    os.makedirs(bin_fasta_path, exist_ok=True)
+
+    if trace:
+        tracer.begin("write", file=bin_fasta_path)
+
+    try:
+        n_records = write_bin_fasta(contigs_file, bins, contig_names, bin_fasta_filenames(bin_fasta_path, bin_labels), nthreads, write_index=fasta_index_file)
+        metrics.count("bin_fasta_records", n_records)
+        logger.info("FASTA files of the bins can be found at "+bin_fasta_path)
+    except (OSError, KeyError, ValueError) as e:
+        logger.error("Failed to write the FASTA files of the bins: "+(e.args[0] if isinstance(e, KeyError) else str(e)))
+
+    if trace:
+        tracer.end()
 
-output_file = output_path + prefix + 'graphbin2_output.csv'
+checkpoint.remove()
 
-with open(output_file, mode='w') as output_file:
-    output_writer = csv.writer(output_file, delimiter=delimiter, quotechar='"', quoting=csv.QUOTE_MINIMAL)
+metrics_file = output_path + prefix + "graphbin2_metrics.json"
+metrics.write(metrics_file, assembler="SPAdes", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins, depth=depth, threshold=threshold, nearest_k=nearest_k, nthreads=nthreads, elapsed_time=time.time()-start_time)
+logger.info("Pipeline metrics can be found at "+metrics_file)
 
-    for row in output_bins:
-        output_writer.writerow(row)
+if memprofile:
+    memory_file = output_path + prefix + "graphbin2_memory.json"
+    memprofiler.write(memory_file, assembler="SPAdes", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins)
+    logger.info("Memory profile can be found at "+memory_file)
 
-logger.info("Final binning results can be found at "+str(output_file.name))
+if trace:
+    trace_file = output_path + prefix + "graphbin2_trace.json"
+    tracer.write(trace_file, assembler="SPAdes", contigs=node_count, edges=assembly_graph.ecount(), bins=n_bins)
+    logger.info("Execution trace can be found at "+trace_file)
 
 
 # Exit program
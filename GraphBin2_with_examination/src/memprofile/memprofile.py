@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+Opt-in memory profiling of the GraphBin2 pipeline.
+
+Records the peak RSS and the top tracemalloc allocations of each stage together with the
+sizes of the main in-memory structures, and writes them to a JSON report.
+"""
+
+import json
+import resource
+import sys
+import tracemalloc
+
+
+def _rss():
+    """Current and peak resident set size of this process in bytes."""
+
+    try:
+        with open("/proc/self/status") as status:
+            fields = dict(line.split(":", 1) for line in status if ":" in line)
+        return int(fields["VmRSS"].split()[0]) * 1024, int(fields["VmHWM"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return peak, peak
+
+
+def _snapshot():
+    """Snapshot of traced allocations without those of the profiler and of imports."""
+
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+
+
+def _reset_peak_rss():
+    """Reset the peak RSS of this process so that it is measured per stage (Linux only)."""
+
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def deep_size(obj):
+    """Size in bytes of an object and of all the objects it references through containers and attributes."""
+
+    # igraph keeps its graph in C; estimate from its edge and vertex index vectors
+    if hasattr(obj, "vcount") and hasattr(obj, "ecount"):
+        return sys.getsizeof(obj) + 8 * (4 * obj.ecount() + 2 * (obj.vcount() + 1))
+
+    seen = set()
+    stack = [obj]
+    size = 0
+
+    while stack:
+        item = stack.pop()
+
+        if id(item) in seen:
+            continue
+
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+
+        if hasattr(item, "__dict__"):
+            stack.append(item.__dict__)
+
+    return size
+
+
+class MemoryProfiler:
+    """Peak RSS, tracemalloc statistics and structure sizes of each pipeline stage."""
+
+    def __init__(self, top=10):
+        self.top = top
+        self.stages = []
+        self.sizes = {}
+        self.current = None
+        self.per_stage_peak = _reset_peak_rss()
+
+        tracemalloc.start()
+
+    def start_stage(self, name):
+        _reset_peak_rss()
+
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+
+        self.current = {"stage": name, "rss_start": _rss()[0], "snapshot": _snapshot()}
+
+    def stop_stage(self, name):
+        if self.current is None:
+            return
+
+        snapshot = _snapshot()
+        traced, traced_peak = tracemalloc.get_traced_memory()
+        rss, peak_rss = _rss()
+
+        top_allocations = []
+
+        for stat in snapshot.compare_to(self.current["snapshot"], "lineno")[:self.top]:
+            top_allocations.append({"location": str(stat.traceback), "size": stat.size, "size_diff": stat.size_diff,
+                                    "count": stat.count, "count_diff": stat.count_diff})
+
+        self.stages.append({
+            "stage": name,
+            "rss_start": self.current["rss_start"],
+            "rss_end": rss,
+            "peak_rss": peak_rss,
+            "children_peak_rss": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024,
+            "traced": traced,
+            "traced_peak": traced_peak,
+            "top_allocations": top_allocations,
+        })
+
+        self.current = None
+
+    def record_sizes(self, **structures):
+        """Record the deep size of named structures, tagged with the running stage."""
+
+        stage = self.current["stage"] if self.current is not None else None
+
+        for name, obj in structures.items():
+            self.sizes[name] = {"stage": stage, "bytes": deep_size(obj),
+                                "length": len(obj) if hasattr(obj, "__len__") else None}
+
+    def write(self, filename, **info):
+        """Write the report of all stages and structure sizes to a JSON file."""
+
+        tracemalloc.stop()
+
+        info["per_stage_peak_rss"] = self.per_stage_peak
+
+        with open(filename, mode='w') as output_file:
+            json.dump({"info": info, "stages": self.stages, "structures": self.sizes}, output_file, indent=2)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""
+Per-stage timing and counters of the GraphBin2 pipeline, written as a JSON file.
+"""
+
+import json
+import os
+import time
+
+from collections import defaultdict
+
+
+def _cpu_time():
+    """CPU time of this process and of its finished child processes (e.g. Pool workers)."""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageMetrics:
+    """Wall time, CPU time, iterations and counters of each pipeline stage.
+
+    Listeners (e.g. the memory profiler) are told when a stage starts and stops
+    through their start_stage(name) and stop_stage(name) methods, and of each
+    iteration through iteration(stage, number, start, end, **counters) if they have it.
+
+    Counts of hot code paths (e.g. every BFS call) are kept as running totals in plain
+    dicts registered with add_totals(), which are added to the stage when it stops."""
+
+    def __init__(self):
+        self.stages = []
+        self.current = None
+        self.listeners = []
+        self.totals_sources = []
+
+    def add_totals(self, totals):
+        """Register a dict of running totals, added to the counters of each stage when it stops and then reset."""
+        self.totals_sources.append(totals)
+
+    def _take_totals(self):
+        """Running totals since the last stop, reset to 0."""
+
+        taken = defaultdict(int)
+
+        for totals in self.totals_sources:
+            for name, value in totals.items():
+                taken[name] += value
+                totals[name] = 0
+
+        return taken
+
+    def start(self, name):
+        """Finish the running stage (if any) and start a new one."""
+
+        self.stop()
+
+        for listener in self.listeners:
+            listener.start_stage(name)
+
+        now, cpu = time.perf_counter(), _cpu_time()
+
+        self.current = {"stage": name, "counters": defaultdict(int), "iterations": [],
+                        "_wall": now, "_cpu": cpu, "_iter_wall": now, "_iter_cpu": cpu}
+
+    def stop(self):
+        """Finish the running stage."""
+
+        taken = self._take_totals()
+
+        if self.current is None:
+            return
+
+        stage = self.current
+        self.current = None
+
+        for name, value in taken.items():
+            if value > 0:
+                stage["counters"][name] += value
+
+        self.stages.append({
+            "stage": stage["stage"],
+            "wall_time": round(time.perf_counter() - stage["_wall"], 6),
+            "cpu_time": round(_cpu_time() - stage["_cpu"], 6),
+            "counters": dict(stage["counters"]),
+            "iterations": stage["iterations"],
+        })
+
+        for listener in self.listeners:
+            listener.stop_stage(stage["stage"])
+
+    def count(self, name, n=1):
+        """Add n to a counter of the running stage."""
+
+        if self.current is not None:
+            self.current["counters"][name] += n
+
+    def iteration(self, **counters):
+        """Record an iteration of the running stage, with the time since the previous one."""
+
+        if self.current is None:
+            return
+
+        stage = self.current
+        now, cpu = time.perf_counter(), _cpu_time()
+
+        stage["iterations"].append(dict({"iteration": len(stage["iterations"])+1,
+                                         "wall_time": round(now - stage["_iter_wall"], 6),
+                                         "cpu_time": round(cpu - stage["_iter_cpu"], 6)}, **counters))
+
+        for listener in self.listeners:
+            if hasattr(listener, "iteration"):
+                listener.iteration(stage["stage"], len(stage["iterations"]), stage["_iter_wall"], now, **counters)
+
+        stage["_iter_wall"], stage["_iter_cpu"] = now, cpu
+
+    def totals(self):
+        """Wall time, CPU time and counters summed over stages of the same name."""
+
+        totals = {}
+
+        for stage in self.stages:
+            total = totals.setdefault(stage["stage"], {"wall_time": 0, "cpu_time": 0, "counters": defaultdict(int)})
+            total["wall_time"] = round(total["wall_time"] + stage["wall_time"], 6)
+            total["cpu_time"] = round(total["cpu_time"] + stage["cpu_time"], 6)
+
+            for name, value in stage["counters"].items():
+                total["counters"][name] += value
+
+        for total in totals.values():
+            total["counters"] = dict(total["counters"])
+
+        return totals
+
+    def write(self, filename, **info):
+        """Finish the running stage and write all stages, their totals and info to a JSON file."""
+
+        self.stop()
+
+        with open(filename, mode='w') as output_file:
+            json.dump({"info": info, "stages": self.stages, "totals": self.totals()}, output_file, indent=2)
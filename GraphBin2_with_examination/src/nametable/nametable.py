@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Compact table of contig names.
+
+All names are kept in one contiguous bytes buffer with an array of offsets, so a
+contig costs its name bytes plus a few words instead of a Python str per contig.
+Names are decoded only when they are read (e.g. when writing output).
+"""
+
+from array import array
+
+import numpy as np
+
+
+class NameTable:
+    """Names of node ids 0..n-1, stored in one bytes buffer.
+
+    Lookups of ids by name go through a single open addressing hash index
+    (name hash -> id), which is built on the first lookup. Each lookup probes the
+    index in Python, so for many lookups in a row use a temporary id_dict()."""
+
+    def __init__(self, names=()):
+        self.buffer = bytearray()
+        self.offsets = array("q", [0])
+        self.index = None
+        self.n_indexed = 0
+
+        for name in names:
+            self.append(name)
+
+    def append(self, name):
+        """Add a name and return its id."""
+
+        self.buffer += name.encode()
+        self.offsets.append(len(self.buffer))
+
+        return len(self.offsets) - 2
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def name_bytes(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return bytes(self.buffer[self.offsets[i]:self.offsets[i+1]])
+
+    def __getitem__(self, i):
+        return self.name_bytes(i).decode()
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _slot(self, name):
+        """Slot of a name in the hash index and the id stored in it (-1 if free)."""
+
+        mask = len(self.index) - 1
+        slot = hash(name) & mask
+
+        while True:
+            i = self.index.item(slot)
+            if i < 0 or self.name_bytes(i) == name:
+                return slot, i
+            slot = (slot + 1) & mask
+
+    def _update_index(self):
+        if self.index is None or 2 * len(self) > len(self.index):
+            size = 1024
+            while size < 3 * len(self):
+                size *= 2
+            self.index = np.full(size, -1, dtype=np.int32 if len(self) < 2**31 else np.int64)
+            self.n_indexed = 0
+
+        for i in range(self.n_indexed, len(self)):
+            slot, _ = self._slot(self.name_bytes(i))
+            self.index[slot] = i
+
+        self.n_indexed = len(self)
+
+    def id(self, name):
+        """Id of a name. Raises a KeyError for unknown names."""
+
+        if self.n_indexed != len(self) or self.index is None:
+            self._update_index()
+
+        _, i = self._slot(name.encode())
+
+        if i < 0:
+            raise KeyError(name)
+
+        return i
+
+    def get(self, name, default=None):
+        try:
+            return self.id(name)
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def id_dict(self):
+        """Dict of the ids of all names, for many lookups in a row (e.g. over all the links of
+        a graph). It holds a str per name again, so drop it when the lookups are done."""
+
+        buffer = bytes(self.buffer)
+        offsets = self.offsets
+
+        return {buffer[offsets[i]:offsets[i+1]].decode(): i for i in range(len(self))}
+
+    @property
+    def inverse(self):
+        """View of the table mapping names to ids, e.g. contig_names.inverse[name]."""
+        return _NameIndex(self)
+
+
+class _NameIndex:
+    """Name to id view of a NameTable."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def __getitem__(self, name):
+        return self.table.id(name)
+
+    def __contains__(self, name):
+        return name in self.table
+
+    def __len__(self):
+        return len(self.table)
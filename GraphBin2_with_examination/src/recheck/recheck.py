@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+
+"""
+Index of the labelled contigs found by the BFS of each contig in the removal stage.
+
+The per-bin counts of a contig can only change when one of the labels its BFS found is
+removed: removing a label lets the BFS pass through that contig, and no other contig's
+BFS changes. So after the first sweep only the contigs whose last BFS found a removed
+label have to be checked again.
+"""
+
+
+class RecheckIndex:
+    """For each contig, the labelled contigs its last BFS found, and the reverse.
+
+    Entries of a contig are replaced when it is checked again and dropped when its own
+    label is removed (it is not checked again), so the index only holds the current BFS
+    results of the contigs which are still checked."""
+
+    def __init__(self):
+        self.found = {}
+        self.found_by = {}
+
+    def _drop(self, node):
+        for labelled in self.found.pop(node, ()):
+            finders = self.found_by.get(labelled)
+
+            if finders is not None:
+                finders.discard(node)
+
+                if len(finders) == 0:
+                    del self.found_by[labelled]
+
+    def update(self, node, labelled_nodes):
+        """Record the labelled contigs found by the BFS of node, replacing its previous ones."""
+
+        self._drop(node)
+
+        labelled_nodes = set(labelled_nodes)
+
+        if len(labelled_nodes) == 0:
+            return
+
+        self.found[node] = labelled_nodes
+
+        for labelled in labelled_nodes:
+            self.found_by.setdefault(labelled, set()).add(node)
+
+    def affected(self, removed):
+        """Contigs whose last BFS found one of the removed labels. The entries of the removed
+        contigs are dropped."""
+
+        affected = set()
+
+        for node in removed:
+            self._drop(node)
+            affected.update(self.found_by.pop(node, ()))
+
+        return affected.difference(removed)
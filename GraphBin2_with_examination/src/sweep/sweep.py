@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Parameter sweep support for GraphBin2.
+
+The assembly graph and the initial binning are parsed once by the parent process.
+Each parameter set is then run in a forked child which inherits the parsed data
+(copy-on-write) and continues the pipeline with its own parameters.
+"""
+
+import csv
+import itertools as it
+import os
+import sys
+import time
+
+
+PARAMETER_TYPES = {
+    "depth": int,
+    "threshold": float,
+    "nearest_k": int,
+    "cov_threshold": int,
+    "len_threshold": int,
+    "skip_ref": lambda x: x.strip().lower() in ("1", "true", "yes", "y"),
+}
+
+
+def read_sweep_grid(filename, allowed):
+    """Read parameter sets from a tab separated file with a header of parameter names.
+
+    Every row is one parameter set. A cell may hold several comma separated values,
+    in which case the row is expanded into the cartesian product of its cells."""
+
+    configs = []
+
+    with open(filename) as grid_file:
+        reader = csv.reader(grid_file, delimiter="\t")
+        header = [name.strip() for name in next(reader)]
+
+        for name in header:
+            if name not in allowed:
+                raise ValueError("Unsupported sweep parameter: " + name)
+
+        for row in reader:
+            if len(row) == 0 or row[0].startswith("#"):
+                continue
+
+            if len(row) != len(header):
+                raise ValueError("Sweep row does not match the header: " + "\t".join(row))
+
+            values = [[PARAMETER_TYPES[name](v) for v in cell.split(",")] for name, cell in zip(header, row)]
+
+            for combination in it.product(*values):
+                configs.append(dict(zip(header, combination)))
+
+    if len(configs) == 0:
+        raise ValueError("No parameter sets found in " + filename)
+
+    return configs
+
+
+def fork_sweep(n_configs, nprocs):
+    """Fork one child per parameter set, running at most nprocs children at a time.
+
+    Returns (index, None) in a child, which should go on with the pipeline for
+    parameter set index. Returns (None, results) in the parent once all children
+    have finished, where results[index] is (exit code, elapsed seconds)."""
+
+    pending = list(range(n_configs))
+    running = {}
+    results = [None] * n_configs
+
+    # Avoid duplicating buffered output in the children
+    sys.stdout.flush()
+    sys.stderr.flush()
+
+    while pending or running:
+
+        while pending and len(running) < nprocs:
+            index = pending.pop(0)
+            pid = os.fork()
+
+            if pid == 0:
+                return index, None
+
+            running[pid] = (index, time.time())
+
+        pid, status = os.wait()
+        index, started = running.pop(pid)
+
+        if os.WIFEXITED(status):
+            exit_code = os.WEXITSTATUS(status)
+        else:
+            exit_code = -os.WTERMSIG(status)
+
+        results[index] = (exit_code, time.time() - started)
+
+    return None, results
+
+
+def write_sweep_summary(configs, results, output_prefixes, filename):
+    """Write parameters, output prefix, exit code and elapsed time of every parameter set."""
+
+    names = [name for name in PARAMETER_TYPES if any(name in config for config in configs)]
+
+    with open(filename, mode='w') as output_file:
+        output_writer = csv.writer(output_file, delimiter="\t", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        output_writer.writerow(["config"] + names + ["prefix", "exit_code", "elapsed_time"])
+
+        for index, config in enumerate(configs):
+            exit_code, elapsed = results[index]
+            output_writer.writerow([index+1] + [config.get(name, "") for name in names] + [output_prefixes[index], exit_code, round(elapsed, 3)])
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+"""
+Opt-in timeline tracing of the GraphBin2 pipeline.
+
+Writes stages, iterations, multi-processing worker tasks and file writes as a
+trace-event JSON file which can be opened in chrome://tracing, Perfetto or speedscope.
+"""
+
+import json
+import os
+import time
+
+
+def _now():
+    """Trace timestamp in microseconds (monotonic and shared by forked workers)."""
+    return time.perf_counter() * 1e6
+
+
+class TracedTask:
+    """Picklable wrapper of a Pool task that also returns the worker pid and the task start and end."""
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args):
+        start = _now()
+        result = self.func(*args)
+        return result, os.getpid(), start, _now()
+
+
+class Tracer:
+    """Trace events of the pipeline kept in memory and written at the end of the run.
+
+    Works as a StageMetrics listener, so stages and iterations are traced without
+    further calls. Worker tasks closer than merge_gap microseconds are merged into
+    one event, so that gaps in the timeline of a worker show where it sat idle."""
+
+    def __init__(self, merge_gap=1000):
+        self.merge_gap = merge_gap
+        self.pid = os.getpid()
+        self.events = []
+        self.stage = None
+        self.open = []
+        self.workers = set()
+
+    def _complete(self, name, cat, start, end, tid=0, **args):
+        self.events.append({"name": name, "cat": cat, "ph": "X", "ts": round(start, 3), "dur": round(end - start, 3),
+                            "pid": self.pid, "tid": tid, "args": args})
+
+    def start_stage(self, name):
+        self.stage = (name, _now())
+
+    def stop_stage(self, name):
+        if self.stage is not None:
+            self._complete(name, "stage", self.stage[1], _now())
+            self.stage = None
+
+    def iteration(self, stage, number, start, end, **counters):
+        self._complete(stage+" iteration "+str(number), "iteration", start * 1e6, end * 1e6, **counters)
+
+    def begin(self, name, cat="io", **args):
+        """Start a span (e.g. a file write), finished by the next call of end()."""
+        self.open.append((name, cat, _now(), args))
+
+    def end(self):
+        name, cat, start, args = self.open.pop()
+        self._complete(name, cat, start, _now(), **args)
+
+    def counter(self, name, **values):
+        """Record the current values of a counter track (e.g. the size of the propagation heap)."""
+        self.events.append({"name": name, "ph": "C", "ts": round(_now(), 3), "pid": self.pid, "args": values})
+
+    def task(self, func):
+        """Wrap a Pool task so that its results can be passed to worker_results()."""
+        return TracedTask(func)
+
+    def worker_results(self, name, mapped):
+        """Trace the tasks of traced Pool results and return the results of the tasks."""
+
+        results = []
+        spans = {}
+
+        for result, pid, start, end in mapped:
+            results.append(result)
+
+            span = spans.get(pid)
+
+            if span is not None and start - span[1] <= self.merge_gap:
+                span[1] = end
+                span[2] += 1
+                continue
+
+            if span is not None:
+                self._complete(name, "worker", span[0], span[1], tid=pid, tasks=span[2])
+
+            spans[pid] = [start, end, 1]
+
+        for pid, span in spans.items():
+            self._complete(name, "worker", span[0], span[1], tid=pid, tasks=span[2])
+            self.workers.add(pid)
+
+        return results
+
+    def write(self, filename, **info):
+        """Write all events in trace-event JSON format."""
+
+        events = [{"name": "process_name", "ph": "M", "pid": self.pid, "args": {"name": "GraphBin2"}},
+                  {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": 0, "args": {"name": "main"}}]
+
+        for pid in sorted(self.workers):
+            events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": pid, "args": {"name": "worker "+str(pid)}})
+
+        with open(filename, mode='w') as output_file:
+            json.dump({"traceEvents": events + self.events, "displayTimeUnit": "ms", "otherData": info}, output_file)
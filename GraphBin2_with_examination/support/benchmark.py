@@ -0,0 +1,185 @@
+#!/usr/bin/python3
+
+"""benchmark.py: Time GraphBin2 end to end and per pipeline stage on simulated assemblies.
+
+Runs GraphBin2 on the assemblies written by simulateAssembly.py and reports the wall
+and CPU time of every pipeline stage, taken from graphbin2_metrics.json (or from the
+timestamps of the GraphBin2 log when no metrics file was written).
+"""
+
+import sys
+import os
+import argparse
+import csv
+import json
+import shlex
+import subprocess
+import time
+
+from datetime import datetime
+
+__author__ = "Vijini Mallawaarachchi, Anuradha Wickramarachchi, and Yu Lin"
+__copyright__ = "Copyright 2020, GraphBin2 Project"
+__license__ = "GPL"
+__type__ = "Support Script"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+
+
+# Sample command
+# -------------------------------------------------------------------
+# python benchmark.py     --data /path/to/simulated_assemblies
+#                         --output /path/to/output_folder
+# -------------------------------------------------------------------
+
+
+# Setup argument parser
+#-----------------------
+
+ap = argparse.ArgumentParser()
+
+ap.add_argument("--data", required=True, type=str, help="path to the folder with the assemblies from simulateAssembly.py")
+ap.add_argument("--output", required=True, type=str, help="path to the output folder")
+ap.add_argument("--assembler", required=False, type=str, default="all", help="assembler to benchmark (SPAdes, SGA, Flye or all) [default: all]")
+ap.add_argument("--repeats", required=False, type=int, default=1, help="number of runs of each assembly [default: 1]")
+ap.add_argument("--nthreads", required=False, type=int, default=8, help="number of threads given to GraphBin2 [default: 8]")
+ap.add_argument("--options", required=False, type=str, default="", help="additional options passed to GraphBin2 [default: \"\"]")
+
+args = vars(ap.parse_args())
+
+data_path = args["data"]
+output_path = args["output"]
+assembler = args["assembler"].lower()
+repeats = args["repeats"]
+nthreads = args["nthreads"]
+options = args["options"]
+
+graphbin2 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "graphbin2")
+
+# Inputs written by simulateAssembly.py for each assembler
+inputs = {
+    "spades": ["--graph", "assembly_graph_with_scaffolds.gfa", "--contigs", "contigs.fasta", "--paths", "contigs.paths"],
+    "sga": ["--graph", "default-graph.asqg", "--contigs", "contigs.fa", "--abundance", "abundance.abund"],
+    "flye": ["--graph", "assembly_graph.gfa", "--contigs", "edges.fasta", "--abundance", "abundance.abund"],
+}
+
+# Log messages marking the start of each pipeline stage
+stage_markers = [
+    ("parsing", "GraphBin2 started"),
+    ("graph_build", "Total number of contigs available"),
+    ("initial_binning", "Total number of edges in the assembly graph"),
+    ("removal", "Removing labels of unsupported vertices"),
+    ("refinement", "Refining labels of inconsistent vertices"),
+    ("component_detection", "Obtaining non isolated contigs"),
+    ("propagation", "Propagating labels to unlabelled vertices"),
+    ("multi_bin", "Determining multi-binned contigs"),
+    ("output", "Elapsed time"),
+    ("end", "Thank you for using GraphBin2"),
+]
+
+if assembler not in ["spades", "sga", "flye", "all"]:
+    print("\nPlease make sure to provide the correct assembler type (SPAdes, SGA, Flye or all).")
+    print("Exiting benchmark.py...\nBye...!\n")
+    sys.exit(1)
+
+if data_path[-1:] != "/":
+    data_path = data_path + "/"
+
+if output_path[-1:] != "/":
+    output_path = output_path + "/"
+
+os.makedirs(output_path, exist_ok=True)
+
+
+def stage_times(run_output):
+    """Get the wall and CPU time of each stage from the metrics file or the log messages."""
+
+    metrics_file = run_output + "graphbin2_metrics.json"
+
+    if os.path.isfile(metrics_file):
+        with open(metrics_file) as metrics:
+            totals = json.load(metrics)["totals"]
+
+        return {stage: (total["wall_time"], total["cpu_time"]) for stage, total in totals.items()}
+
+    log_file = run_output + "graphbin2.log"
+    marks = []
+
+    with open(log_file) as log:
+        for line in log:
+            for stage, marker in stage_markers:
+                if marker in line:
+                    marks.append((stage, datetime.strptime(line[:23], "%Y-%m-%d %H:%M:%S,%f")))
+                    break
+
+    times = {}
+
+    for k in range(len(marks)-1):
+        stage = marks[k][0]
+        times[stage] = (times.get(stage, (0, ""))[0] + (marks[k+1][1] - marks[k][1]).total_seconds(), "")
+
+    return times
+
+
+# Run the benchmark
+#---------------------------------------------------
+
+assemblers = ["spades", "sga", "flye"] if assembler == "all" else [assembler]
+
+rows = []
+
+for name in assemblers:
+
+    folder = data_path + name + "/"
+
+    if not os.path.isdir(folder):
+        print("\nNo", name, "assembly found in", data_path)
+        continue
+
+    for repeat in range(repeats):
+
+        run_output = output_path + name + "_" + str(repeat+1) + "/"
+
+        command = [sys.executable, graphbin2, "--assembler", name, "--binned", folder + "initial_binning.csv",
+                   "--output", run_output, "--nthreads", str(nthreads)]
+        command += [x if x.startswith("--") else folder + x for x in inputs[name]]
+        command += shlex.split(options)
+
+        print("\nRunning GraphBin2 on the", name, "assembly (run", str(repeat+1)+")")
+
+        start_time = time.time()
+
+        with open(output_path + name + "_" + str(repeat+1) + ".log", "w") as run_log:
+            exit_code = subprocess.call(command, stdout=run_log, stderr=subprocess.STDOUT)
+
+        elapsed_time = time.time() - start_time
+
+        if exit_code != 0:
+            print("GraphBin2 failed on the", name, "assembly. Please check", run_log.name)
+            continue
+
+        times = stage_times(run_output)
+        times["total"] = (elapsed_time, "")
+
+        for stage, (wall_time, cpu_time) in times.items():
+            rows.append([name, repeat+1, stage, round(wall_time, 3), cpu_time if cpu_time == "" else round(cpu_time, 3)])
+            print("  ", stage.ljust(20), round(wall_time, 3), "seconds")
+
+
+# Write benchmark results
+#---------------------------------------------------
+
+with open(output_path + "benchmark.tsv", mode='w') as output_file:
+    output_writer = csv.writer(output_file, delimiter="\t", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+    output_writer.writerow(["assembler", "run", "stage", "wall_time", "cpu_time"])
+
+    for row in rows:
+        output_writer.writerow(row)
+
+print("\nBenchmark results can be found at", output_file.name)
+
+
+# Exit program
+#--------------
+
+print("\nThank you for using benchmark for GraphBin2!\n")
@@ -2,16 +2,19 @@
 
 """flye_miniasm_gfa2fasta.py: Obtain the sequences corresponding to edges in the Flye and Miniasm assembly graphs in FASTA format.
 The assembly graph file of Flye (assembly_graph.gfa) should be provided as inputs.
+
+Edge sequences are streamed from the graph to the (optionally compressed) FASTA file one
+record at a time, so only the longest edge is held in memory.
 """
 
 import sys
 import os
 import argparse
-import re
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
 
-from Bio import SeqIO
-from Bio.Seq import Seq
-from Bio.SeqRecord import SeqRecord
+from assemblyio.assemblyio import COMPRESSION_SUFFIXES, open_input, open_output
 
 __author__ = "Vijini Mallawaarachchi, Anuradha Wickramarachchi, and Yu Lin"
 __copyright__ = "Copyright 2020, GraphBin2 Project"
@@ -38,6 +41,7 @@ ap.add_argument("--graph", required=True, help="path to the assembly graph file"
 ap.add_argument("--assembler", required=True, type=str, default='flye', help="type of the assembler (Flye or Miniasm)")
 ap.add_argument("--output", required=True, type=str, help="path to the output folder")
 ap.add_argument("--prefix", required=False, type=str, default='', help="prefix for the output file")
+ap.add_argument("--compression", required=False, type=str, default=None, choices=list(COMPRESSION_SUFFIXES), help="compression of the output file (gzip, bzip2 or zstd)")
 
 args = vars(ap.parse_args())
 
@@ -46,6 +50,13 @@ assembler_name = ""
 assembly_graph_file = args["graph"]
 output_path = args["output"]
 prefix = ""
+compression = args["compression"]
+
+# Bases kept in the edge sequences (lowercase bases are converted to uppercase)
+LINE_WIDTH = 60
+BASES = b"GATCgatc"
+DELETED = bytes(c for c in range(256) if c not in BASES)
+UPPERCASE = bytes.maketrans(b"gatc", b"GATC")
 
 # Check assembly graph file
 if not os.path.isfile(assembly_graph_file):
@@ -92,35 +103,41 @@ except:
 # Get the sequences corresponding to edges of the graph.
 #---------------------------------------------------
 
-print("\nObtaining edge sequences")
+if assembler.lower() == "flye":
+    final_file = "edges.fasta"
+elif assembler.lower() == "miniasm":
+    final_file = "unitigs.fasta"
 
-sequenceset = []
+if compression is not None:
+    final_file += COMPRESSION_SUFFIXES[compression]
 
-with open(assembly_graph_file) as file:
-    line = file.readline()
+print("\nWriting edge sequences to FASTA file")
 
-    while line != "":
+n_sequences = 0
 
-        if "S" in line:
-            strings = line.split("\t")
-            
-            record = SeqRecord(Seq(re.sub('[^GATC]',"",str(strings[2]).upper())), id=str(strings[1]), name=str(strings[1]), description="")
-            
-            sequenceset.append(record)
+try:
+    with open_input(assembly_graph_file) as file, open_output(output_path + prefix + final_file, compression) as output_handle:
 
-        line = file.readline()
+        for line in file:
 
-print("\nWriting edge sequences to FASTA file")
+            if line.startswith(b"S\t"):
+                strings = line.split(b"\t", 3)
 
-if assembler.lower() == "flye":
-    final_file = "edges.fasta"
-elif assembler.lower() == "miniasm":
-    final_file = "unitigs.fasta"
+                sequence = strings[2].translate(UPPERCASE, DELETED) if len(strings) > 2 else b""
+
+                output_handle.write(b">" + strings[1].rstrip(b"\r\n") + b"\n")
 
-with open(output_path + prefix + final_file, "w") as output_handle:
-    SeqIO.write(sequenceset, output_handle, "fasta")
+                for start in range(0, len(sequence), LINE_WIDTH):
+                    output_handle.write(sequence[start:start+LINE_WIDTH] + b"\n")
+
+                n_sequences += 1
+
+except ImportError as error:
+    print("\n"+str(error))
+    print("Exiting flye_miniasm_gfa2fasta.py...\nBye...!\n")
+    sys.exit(1)
 
-print("\nThe FASTA file with", assembler_name, "sequences can be found at", output_handle.name)
+print("\nThe FASTA file with", n_sequences, assembler_name, "sequences can be found at", output_path + prefix + final_file)
 
 
 # Exit program
@@ -14,7 +14,9 @@ import argparse
 import re
 import subprocess
 
-from Bio import SeqIO
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from assemblyio.assemblyio import fasta_lengths
 
 __author__ = "Vijini Mallawaarachchi, Anuradha Wickramarachchi, and Yu Lin"
 __copyright__ = "Copyright 2020, GraphBin2 Project"
@@ -145,8 +147,10 @@ for bin_file in files:
         bin_line.append(str(i))
         bin_ids.append(bin_line)
 
-        for index, record in enumerate(SeqIO.parse(contig_bins_folder+bin_file, "fasta")):
-            contig_name = str(record.id)
+        # Contig names are taken from the .fai index of the bin (built on the first run)
+        contig_names, _ = fasta_lengths(contig_bins_folder+bin_file)
+
+        for contig_name in contig_names:
 
             line = []
 
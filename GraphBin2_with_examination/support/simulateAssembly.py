@@ -0,0 +1,332 @@
+#!/usr/bin/python3
+
+"""simulateAssembly.py: Generate synthetic assembly graphs for benchmarking GraphBin2.
+
+Writes SPAdes (contigs.fasta, contigs.paths, assembly_graph_with_scaffolds.gfa),
+SGA (contigs.fa, abundance.abund, default-graph.asqg) and Flye (edges.fasta,
+abundance.abund, assembly_graph.gfa) inputs together with an initial binning
+result and a gold standard binning at a configurable scale.
+"""
+
+import sys
+import os
+import argparse
+import csv
+import math
+import random
+import subprocess
+
+__author__ = "Vijini Mallawaarachchi, Anuradha Wickramarachchi, and Yu Lin"
+__copyright__ = "Copyright 2020, GraphBin2 Project"
+__license__ = "GPL"
+__type__ = "Support Script"
+__maintainer__ = "Vijini Mallawaarachchi"
+__email__ = "vijini.mallawaarachchi@anu.edu.au"
+
+
+# Sample command
+# -------------------------------------------------------------------
+# python simulateAssembly.py   --output /path/to/output_folder
+#                              --contigs 100000 --bins 20
+# -------------------------------------------------------------------
+
+
+# Setup argument parser
+#-----------------------
+
+ap = argparse.ArgumentParser()
+
+ap.add_argument("--output", required=True, type=str, help="path to the output folder")
+ap.add_argument("--assembler", required=False, type=str, default="all", help="assembler to simulate (SPAdes, SGA, Flye or all) [default: all]")
+ap.add_argument("--contigs", required=False, type=int, default=10000, help="number of contigs [default: 10000]")
+ap.add_argument("--edges", required=False, type=float, default=1.5, help="number of edges per contig [default: 1.5]")
+ap.add_argument("--bins", required=False, type=int, default=10, help="number of genomes (bins) [default: 10]")
+ap.add_argument("--component_size", required=False, type=float, default=50, help="mean number of contigs in a connected component [default: 50]")
+ap.add_argument("--component_dist", required=False, type=str, default="lognormal", help="distribution of component sizes (fixed, lognormal or powerlaw) [default: lognormal]")
+ap.add_argument("--mean_length", required=False, type=int, default=2000, help="mean contig length [default: 2000]")
+ap.add_argument("--mixing", required=False, type=float, default=0.05, help="fraction of contigs of a component belonging to another genome [default: 0.05]")
+ap.add_argument("--shared", required=False, type=float, default=0.01, help="fraction of contigs shared by two genomes [default: 0.01]")
+ap.add_argument("--binned", required=False, type=float, default=0.6, help="fraction of contigs in the initial binning result [default: 0.6]")
+ap.add_argument("--error_rate", required=False, type=float, default=0.05, help="fraction of wrong labels in the initial binning result [default: 0.05]")
+ap.add_argument("--gfa_paths", required=False, default=False, action="store_true", help="add contig paths as P lines to the SPAdes assembly graph")
+ap.add_argument("--seed", required=False, type=int, default=1, help="random seed [default: 1]")
+
+args = vars(ap.parse_args())
+
+output_path = args["output"]
+assembler = args["assembler"].lower()
+n_contigs = args["contigs"]
+edges_per_contig = args["edges"]
+n_bins = args["bins"]
+component_size = args["component_size"]
+component_dist = args["component_dist"].lower()
+mean_length = args["mean_length"]
+mixing = args["mixing"]
+shared = args["shared"]
+binned_fraction = args["binned"]
+error_rate = args["error_rate"]
+gfa_paths = args["gfa_paths"]
+
+random.seed(args["seed"])
+
+if assembler not in ["spades", "sga", "flye", "all"]:
+    print("\nPlease make sure to provide the correct assembler type (SPAdes, SGA, Flye or all).")
+    print("Exiting simulateAssembly.py...\nBye...!\n")
+    sys.exit(1)
+
+if component_dist not in ["fixed", "lognormal", "powerlaw"]:
+    print("\nPlease make sure to provide a valid component size distribution (fixed, lognormal or powerlaw).")
+    print("Exiting simulateAssembly.py...\nBye...!\n")
+    sys.exit(1)
+
+if n_contigs < 1 or n_bins < 1 or component_size < 1:
+    print("\nPlease enter valid numbers for contigs, bins and component size.")
+    print("Exiting simulateAssembly.py...\nBye...!\n")
+    sys.exit(1)
+
+# Handle for missing trailing forwardslash in output folder path
+if output_path[-1:] != "/":
+    output_path = output_path + "/"
+
+# Create output folder if it does not exist
+if not os.path.isdir(output_path):
+    subprocess.run("mkdir -p "+output_path, shell=True)
+
+
+# Random sequences
+#---------------------------------------------------
+
+BASES = bytes(b"ACGT"[i % 4] for i in range(256))
+
+def random_sequence(length):
+    return os.urandom(length).translate(BASES).decode()
+
+
+# Simulate the genomes and the connected components
+#---------------------------------------------------
+
+print("\nSimulating", n_contigs, "contigs from", n_bins, "genomes")
+
+genome_coverages = [math.exp(random.uniform(math.log(5), math.log(200))) for x in range(n_bins)]
+
+def component_sizes():
+    sizes = []
+    total = 0
+
+    while total < n_contigs:
+        if component_dist == "fixed":
+            size = int(component_size)
+        elif component_dist == "lognormal":
+            size = int(random.lognormvariate(math.log(component_size) - 0.5, 1.0)) + 1
+        else:
+            size = int(random.paretovariate(1.5) * component_size / 3) + 1
+
+        size = min(size, n_contigs - total)
+        sizes.append(size)
+        total += size
+
+    return sizes
+
+genomes = []
+second_genomes = []
+lengths = []
+coverages = []
+edges = set()
+
+start = 0
+
+for size in component_sizes():
+
+    genome = random.randrange(n_bins)
+    members = list(range(start, start+size))
+
+    for i in members:
+        contig_genome = genome if random.random() >= mixing else random.randrange(n_bins)
+        genomes.append(contig_genome)
+        lengths.append(max(int(random.lognormvariate(math.log(mean_length) - 0.5, 1.0)), 100))
+
+        # Contigs shared by two genomes have the sum of their coverages
+        if n_bins > 1 and random.random() < shared:
+            other = random.choice([x for x in range(n_bins) if x != contig_genome])
+            second_genomes.append(other)
+            coverages.append(genome_coverages[contig_genome] + genome_coverages[other])
+        else:
+            second_genomes.append(-1)
+            coverages.append(genome_coverages[contig_genome])
+
+        coverages[-1] = max(int(random.gauss(coverages[-1], coverages[-1] * 0.1)), 1)
+
+    # Spanning tree of the component followed by extra edges inside the component
+    for k in range(1, size):
+        edges.add((members[random.randrange(k)], members[k]))
+
+    n_extra = int(size * (edges_per_contig - 1)) if size > 2 else 0
+
+    for k in range(max(n_extra, 0)):
+        a, b = random.sample(members, 2)
+        edges.add((min(a, b), max(a, b)))
+
+    start += size
+
+edges = sorted(edges)
+
+print("Simulated", len(edges), "edges")
+
+
+# Initial binning result and gold standard
+#---------------------------------------------------
+
+initial_bins = {}
+
+for i in range(n_contigs):
+    # Longer contigs are more likely to be binned by existing tools
+    if random.random() < binned_fraction * min(1.0, 0.5 + lengths[i] / (2 * mean_length)):
+        initial_bins[i] = genomes[i] if random.random() >= error_rate else random.randrange(n_bins)
+
+def write_binning(names, folder):
+    with open(folder + "initial_binning.csv", mode='w') as output_file:
+        output_writer = csv.writer(output_file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        for i in sorted(initial_bins):
+            output_writer.writerow([names[i], initial_bins[i]+1])
+
+    with open(folder + "gold_standard.csv", mode='w') as output_file:
+        output_writer = csv.writer(output_file, delimiter=",", quotechar='"', quoting=csv.QUOTE_MINIMAL)
+        for i in range(n_contigs):
+            output_writer.writerow([names[i], genomes[i]+1, lengths[i]])
+            if second_genomes[i] != -1:
+                output_writer.writerow([names[i], second_genomes[i]+1, lengths[i]])
+
+def write_abundance(names, folder):
+    with open(folder + "abundance.abund", mode='w') as output_file:
+        for i in range(n_contigs):
+            output_file.write(names[i] + "\t" + str(coverages[i]) + "\n")
+
+def write_fasta(names, sequences, filename):
+    with open(filename, mode='w') as output_file:
+        for i in range(n_contigs):
+            output_file.write(">" + names[i] + "\n")
+            for k in range(0, len(sequences[i]), 80):
+                output_file.write(sequences[i][k:k+80] + "\n")
+
+
+# SPAdes
+#---------------------------------------------------
+
+if assembler in ["spades", "all"]:
+
+    print("\nWriting SPAdes assembly")
+
+    folder = output_path + "spades/"
+    os.makedirs(folder, exist_ok=True)
+
+    names = ["NODE_"+str(i+1)+"_length_"+str(lengths[i])+"_cov_"+str(coverages[i])+"."+str(random.randrange(1000000)).zfill(6) for i in range(n_contigs)]
+
+    # Each contig is a path of one to three segments
+    segment_count = 0
+    paths = []
+    segment_lengths = []
+
+    for i in range(n_contigs):
+        n_segments = random.choice([1, 1, 2, 3])
+        path = []
+        for k in range(n_segments):
+            segment_count += 1
+            path.append(str(segment_count) + random.choice(["+", "-"]))
+            segment_lengths.append(max(lengths[i] // n_segments, 56))
+        paths.append(path)
+
+    def reverse_path(path):
+        return [s[:-1] + ("-" if s.endswith("+") else "+") for s in reversed(path)]
+
+    with open(folder + "contigs.paths", mode='w') as output_file:
+        for i in range(n_contigs):
+            for name, path in [(names[i], paths[i]), (names[i]+"'", reverse_path(paths[i]))]:
+                output_file.write(name + "\n")
+
+                # Some contigs have gaps which split their paths over several lines
+                if len(path) > 1 and random.random() < 0.05:
+                    output_file.write(",".join(path[:1]) + ";\n" + ",".join(path[1:]) + "\n")
+                else:
+                    output_file.write(",".join(path) + "\n")
+
+    with open(folder + "assembly_graph_with_scaffolds.gfa", mode='w') as output_file:
+        output_file.write("H\tVN:Z:1.0\n")
+
+        for k in range(segment_count):
+            output_file.write("S\t" + str(k+1) + "\t" + random_sequence(segment_lengths[k]) + "\tKC:i:" + str(segment_lengths[k] * 10) + "\n")
+
+        for a, b in edges:
+            end_a = paths[a][-1]
+            start_b = paths[b][0]
+            output_file.write("L\t" + end_a[:-1] + "\t" + end_a[-1] + "\t" + start_b[:-1] + "\t" + start_b[-1] + "\t55M\n")
+
+        if gfa_paths:
+            for i in range(n_contigs):
+                output_file.write("P\t" + names[i] + "_1\t" + ",".join(paths[i]) + "\t*\n")
+
+    write_fasta(names, [random_sequence(lengths[i]) for i in range(n_contigs)], folder + "contigs.fasta")
+    write_binning(names, folder)
+
+
+# SGA
+#---------------------------------------------------
+
+if assembler in ["sga", "all"]:
+
+    print("\nWriting SGA assembly")
+
+    folder = output_path + "sga/"
+    os.makedirs(folder, exist_ok=True)
+
+    names = ["contig-"+str(i) for i in range(n_contigs)]
+    sequences = [random_sequence(lengths[i]) for i in range(n_contigs)]
+
+    with open(folder + "default-graph.asqg", mode='w') as output_file:
+        output_file.write("HT\tVN:i:1\tER:f:0\tOL:i:95\tIN:Z:reads.fa\tCN:i:1\tTE:i:0\n")
+
+        for i in range(n_contigs):
+            output_file.write("VT\t" + names[i] + "\t" + sequences[i] + "\tSS:i:0\n")
+
+        for a, b in edges:
+            overlap = min(lengths[a], lengths[b], 95)
+            output_file.write("ED\t" + names[a] + " " + names[b] + " " + str(lengths[a]-overlap) + " " + str(lengths[a]-1) + " " + str(lengths[a]) + " 0 " + str(overlap-1) + " " + str(lengths[b]) + " 0 0\n")
+
+    write_fasta(names, sequences, folder + "contigs.fa")
+    write_abundance(names, folder)
+    write_binning(names, folder)
+
+
+# Flye
+#---------------------------------------------------
+
+if assembler in ["flye", "all"]:
+
+    print("\nWriting Flye assembly")
+
+    folder = output_path + "flye/"
+    os.makedirs(folder, exist_ok=True)
+
+    names = ["edge_"+str(i+1) for i in range(n_contigs)]
+    sequences = [random_sequence(lengths[i]) for i in range(n_contigs)]
+
+    with open(folder + "assembly_graph.gfa", mode='w') as output_file:
+        output_file.write("H\tVN:Z:1.0\n")
+
+        for i in range(n_contigs):
+            output_file.write("S\t" + names[i] + "\t" + sequences[i] + "\tKC:i:" + str(lengths[i] * coverages[i]) + "\tLN:i:" + str(lengths[i]) + "\tdp:i:" + str(coverages[i]) + "\n")
+
+        for a, b in edges:
+            output_file.write("L\t" + names[a] + "\t" + random.choice(["+", "-"]) + "\t" + names[b] + "\t" + random.choice(["+", "-"]) + "\t0M\n")
+
+    write_fasta(names, sequences, folder + "edges.fasta")
+    write_abundance(names, folder)
+    write_binning(names, folder)
+
+
+print("\nSimulated assemblies can be found at", output_path)
+
+
+# Exit program
+#--------------
+
+print("\nThank you for using simulateAssembly for GraphBin2!\n")
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Regression test of the nearest-k early exit of runBFS in the three GraphBin2 scripts.
+
+runBFS is defined inside the scripts, so it is taken from their source and run with the
+globals it uses."""
+
+import ast
+import os
+
+import pytest
+
+from igraph import Graph, ALL
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+
+SCRIPTS = ["graphbin2_SPAdes.py", "graphbin2_SGA.py", "graphbin2_Flye.py"]
+
+# Labelled contigs 3 and 6 are both at depth 2 from contig 0. Contig 5 is queued at
+# depth 2 by contig 2 and found again by contig 4, which raises its depth to 3 while it is
+# still queued in front of contig 6.
+EDGES = [(0, 1), (0, 2), (1, 3), (1, 4), (2, 5), (4, 5), (2, 6)]
+LABELLED = [3, 6]
+
+
+def load_runBFS(script, nearest_k):
+    with open(os.path.join(SRC, script)) as file:
+        tree = ast.parse(file.read())
+
+    function = next(node for node in tree.body if isinstance(node, ast.FunctionDef) and node.name == "runBFS")
+
+    assembly_graph = Graph()
+    assembly_graph.add_vertices(7)
+    assembly_graph.add_edges(EDGES)
+
+    namespace = {"ALL": ALL,
+                 "depth": 5,
+                 "nearest_k": nearest_k,
+                 "assembly_graph": assembly_graph,
+                 "binned_contigs": list(LABELLED),
+                 "unbinned_contigs": [],
+                 "bins": [[3], [6]],
+                 "n_bins": 2,
+                 "coverages": [10] * 7,
+                 "gold_standard": "",
+                 "gs_seq_dict": {},
+                 "bfs_totals": {"bfs_calls": 0, "nodes_visited": 0, "bfs_early_exits": 0}}
+
+    exec(compile(ast.Module(body=[function], type_ignores=[]), script, "exec"), namespace)
+
+    return namespace["runBFS"]
+
+
+@pytest.mark.parametrize("script", SCRIPTS)
+def test_nearest_k_keeps_ties_at_kth_distance(script):
+    full = load_runBFS(script, 0)(0)
+    nearest = load_runBFS(script, 1)(0)
+
+    assert sorted(x[1] for x in full) == LABELLED
+    assert sorted(x[1] for x in nearest) == LABELLED